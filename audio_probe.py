@@ -0,0 +1,97 @@
+"""Cheap container-level facts about an input file.
+
+ffprobe is used when it is on PATH, but imageio_ffmpeg only bundles
+ffmpeg, so the usual source is the stream banner ``ffmpeg -i`` prints;
+soundfile is the last resort for the duration.
+"""
+
+from __future__ import annotations
+
+import json
+import re
+import subprocess
+
+_DURATION = re.compile(r"Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)")
+_INPUT    = re.compile(r"Input #0,\s*([^,]+(?:,[^,]+)*?),\s*from")
+_AUDIO    = re.compile(r"Stream #0:\d+.*?: Audio: (\w+)[^,]*(?:,\s*(\d+) Hz)?(?:,\s*([^,]+))?")
+_LAYOUTS  = {"mono": 1, "stereo": 2, "2.1": 3, "quad": 4, "5.0": 5, "5.1": 6, "7.1": 8}
+
+
+def _ffmpeg() -> str:
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe() or "ffmpeg"
+    except Exception:
+        return "ffmpeg"
+
+
+def _from_ffprobe(path: str, info: dict) -> bool:
+    try:
+        out = subprocess.run(
+            ["ffprobe", "-v", "error", "-print_format", "json",
+             "-show_format", "-show_streams", "-select_streams", "a:0", str(path)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        data = json.loads(out or "{}")
+    except (OSError, subprocess.CalledProcessError, ValueError):
+        return False
+
+    fmt = data.get("format", {})
+    stream = (data.get("streams") or [{}])[0]
+    try:
+        info["duration"] = float(fmt.get("duration") or stream.get("duration") or 0.0)
+    except ValueError:
+        pass
+    info["format"] = fmt.get("format_name", "")
+    info["codec"] = stream.get("codec_name", "")
+    info["sample_rate"] = int(stream.get("sample_rate") or 0)
+    info["channels"] = int(stream.get("channels") or 0)
+    return True
+
+
+def _from_ffmpeg(path: str, info: dict) -> None:
+    """Fill *info* from the banner of ``ffmpeg -i`` (which exits 1 without
+    an output file – that's expected)."""
+    try:
+        banner = subprocess.run([_ffmpeg(), "-hide_banner", "-i", str(path)],
+                                capture_output=True, text=True).stderr
+    except OSError:
+        return
+    m = _DURATION.search(banner)
+    if m:
+        h, mins, s = m.groups()
+        info["duration"] = int(h) * 3600 + int(mins) * 60 + float(s)
+    m = _INPUT.search(banner)
+    if m:
+        info["format"] = m.group(1)
+    m = _AUDIO.search(banner)
+    if m:
+        codec, rate, layout = m.groups()
+        info["codec"] = codec
+        info["sample_rate"] = int(rate or 0)
+        layout = (layout or "").strip()
+        chans = re.match(r"(\d+) channels", layout)
+        info["channels"] = int(chans.group(1)) if chans else _LAYOUTS.get(layout.split("(")[0], 0)
+
+
+def probe(path: str) -> dict:
+    """Return {"duration", "format", "codec", "sample_rate", "channels"} for
+    *path*. Fields that can't be determined are 0 / "" (never raises)."""
+    info = {"duration": 0.0, "format": "", "codec": "", "sample_rate": 0, "channels": 0}
+    if not _from_ffprobe(path, info):
+        _from_ffmpeg(path, info)
+    if info["duration"] <= 0:
+        try:
+            import soundfile as sf
+            meta = sf.info(str(path))
+            info["duration"] = float(meta.duration)
+            info["sample_rate"] = info["sample_rate"] or int(meta.samplerate)
+            info["channels"] = info["channels"] or int(meta.channels)
+        except Exception:
+            pass
+    return info
+
+
+def duration(path: str) -> float:
+    """Return the duration of *path* in seconds (0.0 if it can't be told)."""
+    return probe(path)["duration"]
@@ -15,6 +15,7 @@ import numpy as np
 import soundfile as sf
 import librosa
 
+from resources import subprocess_env
 from ultimate_chord_reader import overwrite_and_remove
 
 
@@ -31,7 +32,7 @@ def _separate_drums(src: str, work_dir: str) -> Path:
         "-o", str(out),
         src,
     ]
-    subprocess.run(cmd, check=True,
+    subprocess.run(cmd, check=True, env=subprocess_env(),
                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
 
     drum = next(out.rglob("drums.wav"), None)
@@ -62,7 +63,7 @@ def _librosa_beats(wav_path: str) -> list[float]:
     3.  return librosa.frames_to_time(beat_frames, sr=sr).tolist()
     """
 
-    y, sr = librosa.load(wav_path, sr=44100, mono=True)
+    y, sr = librosa.load(wav_path, sr=44100, mono=True, dtype=np.float32)
     _, beat_frames = librosa.beat.beat_track(
         y=y,
         sr=sr,
@@ -120,7 +121,7 @@ def get_bpm_from_drums(src: str) -> Tuple[float, List[float]]:
 def bpm_via_librosa(wav_path: str) -> tuple[float, list[float]]:
     """Return (bpm, beat_times) from *wav_path* or raise RuntimeError."""
     import librosa
-    y, sr = librosa.load(wav_path, sr=None, mono=True)
+    y, sr = librosa.load(wav_path, sr=None, mono=True, dtype=np.float32)
     tempo, frames = librosa.beat.beat_track(
         y=y, sr=sr, units="frames", start_bpm=90, tightness=400, trim=False
     )
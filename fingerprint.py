@@ -0,0 +1,160 @@
+"""Cheap audio fingerprints to spot duplicate inputs before analysis.
+
+Each file is decoded once at 11 025 Hz mono and reduced to a coarse chroma
+sequence and loudness envelope over a fixed number of time steps.  Two
+files match when their chroma sequences correlate (each pitch class is
+mean-centred over time, so sharing a key isn't enough) and their durations
+agree to about a second; the envelope only counts when both files have
+real dynamics.  Byte-identical files always match via their SHA-256.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import subprocess
+import time
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from resources import ffmpeg_threads
+
+FP_RATE           = 11025   # decode rate – plenty for chroma below 5 kHz
+FP_FRAME          = 4096    # FFT size (~0.37 s)
+FP_HOP            = 5512    # ~0.5 s between frames
+FP_STEPS          = 64      # time resolution of the stored profile
+DUP_SIMILARITY    = 0.90    # correlation needed for a near duplicate
+DUP_DURATION_TOL  = 1.0     # allowed duration difference, seconds
+ENERGY_WEIGHT     = 0.1     # share of the envelope in the correlation
+ENERGY_DYNAMIC    = 0.1     # envelope std/mean below this is "flat", ignored
+
+
+def _sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _decode(path: Path) -> np.ndarray:
+    """Low-rate mono float32 decode via the bundled ffmpeg."""
+    pcm = subprocess.run(
+        ["ffmpeg", "-v", "error", *ffmpeg_threads(), "-i", str(path),
+         "-ac", "1", "-ar", str(FP_RATE), "-f", "f32le", "-"],
+        check=True, capture_output=True,
+    ).stdout
+    return np.frombuffer(pcm, dtype=np.float32)
+
+
+def _unit(block: np.ndarray) -> np.ndarray:
+    """Mean-centre *block* along time and scale it to unit norm."""
+    block = block - block.mean(axis=0)
+    return (block / (np.linalg.norm(block) + 1e-9)).ravel().astype(np.float32)
+
+
+def _profile(y: np.ndarray) -> Tuple[np.ndarray, np.ndarray, float]:
+    """(chroma, envelope, dynamics) for mono *y*.
+
+    *chroma* is FP_STEPS × 12 and *envelope* FP_STEPS long, each centred
+    and unit-norm on its own so a dot product is a correlation; *dynamics*
+    is the envelope's std/mean.
+    """
+    if len(y) < FP_FRAME:
+        y = np.pad(y, (0, FP_FRAME - len(y)))
+    n = 1 + (len(y) - FP_FRAME) // FP_HOP
+    idx = np.arange(FP_FRAME)[None, :] + FP_HOP * np.arange(n)[:, None]
+    frames = y[idx] * np.hanning(FP_FRAME).astype(np.float32)
+    mag = np.abs(np.fft.rfft(frames, axis=1)).astype(np.float32)
+
+    freqs = np.fft.rfftfreq(FP_FRAME, 1.0 / FP_RATE)
+    band = (freqs >= 55.0) & (freqs <= 5000.0)
+    pc = np.round(12 * np.log2(freqs[band] / 440.0)).astype(int) % 12
+    chroma = np.zeros((n, 12), dtype=np.float32)
+    for k in range(12):
+        chroma[:, k] = mag[:, band][:, pc == k].sum(axis=1)
+    chroma /= chroma.sum(axis=1, keepdims=True) + 1e-9
+    energy = np.sqrt(np.mean(np.square(frames), axis=1))
+
+    steps = [(c.mean(axis=0), e.mean())
+             for c, e in zip(np.array_split(chroma, FP_STEPS),
+                             np.array_split(energy, FP_STEPS)) if len(c)]
+    chroma_steps = np.stack([c for c, _e in steps])
+    envelope = np.array([e for _c, e in steps], dtype=np.float32)
+    dynamics = float(envelope.std() / (envelope.mean() + 1e-9))
+    return _unit(chroma_steps), _unit(envelope), dynamics
+
+
+def fingerprint(path: Path) -> dict:
+    """Return {"sha256", "duration", "chroma", "envelope", "dynamics"} for *path*."""
+    y = _decode(path)
+    chroma, envelope, dynamics = _profile(y)
+    return {
+        "sha256": _sha256(path),
+        "duration": len(y) / FP_RATE,
+        "chroma": chroma,
+        "envelope": envelope,
+        "dynamics": dynamics,
+    }
+
+
+def _similarity(a: dict, b: dict) -> float:
+    """Correlation of two fingerprints: the chroma sequences, plus a little
+    of the loudness envelope when both files have one worth comparing."""
+    if a["chroma"].shape != b["chroma"].shape:
+        return 0.0
+    score = float(np.dot(a["chroma"], b["chroma"]))
+    if min(a["dynamics"], b["dynamics"]) >= ENERGY_DYNAMIC:
+        score = (1 - ENERGY_WEIGHT) * score \
+            + ENERGY_WEIGHT * float(np.dot(a["envelope"], b["envelope"]))
+    return score
+
+
+def _same(a: dict, b: dict) -> bool:
+    if a["sha256"] == b["sha256"]:
+        return True
+    if abs(a["duration"] - b["duration"]) > DUP_DURATION_TOL:
+        return False
+    return _similarity(a, b) >= DUP_SIMILARITY
+
+
+def group_duplicates(paths: Sequence[Path]) -> List[List[Path]]:
+    """Group *paths* into exact/near duplicates, keeping input order.
+
+    The first path of every group is its representative.  Files that can't
+    be decoded stay in a group of their own.
+    """
+    t0 = time.perf_counter()
+    prints: Dict[Path, dict] = {}
+    for p in paths:
+        try:
+            prints[p] = fingerprint(p)
+        except (OSError, subprocess.CalledProcessError) as exc:
+            print(f"[Dedupe] could not fingerprint {p.name} ({exc})")
+
+    parent = list(range(len(paths)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, a in enumerate(paths):
+        for j in range(i + 1, len(paths)):
+            b = paths[j]
+            if a in prints and b in prints and find(i) != find(j) \
+                    and _same(prints[a], prints[b]):
+                parent[find(j)] = find(i)
+
+    groups: Dict[int, List[Path]] = {}
+    for i, p in enumerate(paths):
+        groups.setdefault(find(i), []).append(p)
+
+    audio = sum(fp["duration"] for fp in prints.values())
+    elapsed = time.perf_counter() - t0
+    dups = sum(len(g) - 1 for g in groups.values())
+    print(f"[Dedupe] {len(paths)} files, {dups} duplicates "
+          f"({elapsed:.1f}s for {audio / 60:.1f} min audio)")
+    return list(groups.values())
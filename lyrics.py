@@ -2,22 +2,237 @@
 
 from __future__ import annotations
 
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple
 from pathlib import Path
 
 import math
 import re
+import threading
+import time
+import wave
 from spellchecker import SpellChecker
 
 import whisper  # provided by the *openai-whisper* package (pip install openai-whisper)
 
+import metrics
+from resources import ffmpeg_threads, pool_size, worker_threads
+
 import os, shutil, pathlib, imageio_ffmpeg, tempfile, subprocess  # provides self-contained binaries
 
-os.environ.setdefault("TORCH_HOME", "/tmp")
+from models.weights import configure as configure_weights, load_whisper
+
+configure_weights()                # weights → persistent store (never audio)
 os.environ.setdefault("XDG_CACHE_HOME", "/tmp")
 
 _spell = SpellChecker()
 
+# ----------------------------------------------------------------------
+# Backend settings – defaults match the historical behaviour
+# (fp32 "base" model, language auto-detection, temperature fallback).
+# Each one can be overridden per call or through the environment.
+# ----------------------------------------------------------------------
+DEFAULT_MODEL    = "base"
+_MODEL_ENV       = "UCR_WHISPER_MODEL"     # tiny / base / small / medium / ...
+_QUANTIZE_ENV    = "UCR_WHISPER_INT8"      # "1" → int8 dynamic quantization
+_LANGUAGE_ENV    = "UCR_WHISPER_LANGUAGE"  # e.g. "en" → skip language detection
+_GREEDY_ENV      = "UCR_WHISPER_GREEDY"    # "1" → temperature 0, no fallback
+_WORKERS_ENV     = "UCR_WHISPER_WORKERS"   # >1 → chunked decoding in a process pool
+
+CHUNK_SECONDS    = 120.0   # target chunk length for parallel decoding
+CHUNK_SEARCH     = 15.0    # look ± this far from the target for a silence
+CHUNK_PAD        = 1.0     # audio context shared with each neighbour
+SAMPLE_RATE      = 16000
+
+_MODELS: Dict[Tuple[str, bool], "whisper.Whisper"] = {}
+# Whisper's kv-cache hooks live on the model, so one cached model decodes
+# one stem at a time; sessions running several analyses queue up here.
+_DECODE_LOCKS: Dict[Tuple[str, bool], threading.Lock] = {}
+_CACHE_LOCK = threading.Lock()
+
+
+def _env_flag(name: str) -> bool:
+    return os.environ.get(name, "").strip().lower() in {"1", "true", "yes", "on"}
+
+
+def resolve_model(model_size: Optional[str] = None,
+                  quantize: Optional[bool] = None) -> Tuple[str, bool]:
+    """(model size, int8) for the given options, falling back to
+    ``UCR_WHISPER_MODEL`` / ``UCR_WHISPER_INT8``, then to fp32 "base"."""
+    model_size = model_size or os.environ.get(_MODEL_ENV) or DEFAULT_MODEL
+    quantize = _env_flag(_QUANTIZE_ENV) if quantize is None else quantize
+    return model_size, quantize
+
+
+def _quantize_int8(model):
+    """int8 dynamic quantization of every Linear layer of *model*.
+
+    Whisper's layers are ``whisper.model.Linear``, a subclass that
+    ``quantize_dynamic`` skips (it matches exact types), so they are first
+    swapped for plain ``nn.Linear`` modules sharing the same parameters.
+    """
+    import torch
+    for parent in list(model.modules()):
+        for name, child in list(parent.named_children()):
+            if isinstance(child, torch.nn.Linear) and type(child) is not torch.nn.Linear:
+                plain = torch.nn.Linear(child.in_features, child.out_features,
+                                        bias=child.bias is not None, device="meta")
+                plain.weight, plain.bias = child.weight, child.bias
+                setattr(parent, name, plain)
+
+    model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    n = sum(isinstance(m, torch.ao.nn.quantized.dynamic.Linear) for m in model.modules())
+    if n == 0:
+        raise RuntimeError("int8 quantization matched no Linear layers")
+    print(f"[Whisper] int8: {n} Linear layers quantized")
+    return model
+
+
+def _load_model(size: str, quantize: bool):
+    """Return a cached Whisper model, int8-quantized for CPU when asked."""
+    key = (size, quantize)
+    with _CACHE_LOCK:
+        if key not in _MODELS:
+            if quantize:
+                model = _quantize_int8(load_whisper(size, device="cpu"))
+            else:
+                model = load_whisper(size)
+            _MODELS[key] = model
+        _DECODE_LOCKS.setdefault(key, threading.Lock())
+        return _MODELS[key]
+
+
+def load_model(model_size: Optional[str] = None, quantize: Optional[bool] = None):
+    """Load (and cache) the Whisper model :func:`transcribe` would use."""
+    return _load_model(*resolve_model(model_size, quantize))
+
+
+def _wav_seconds(path: Path) -> float:
+    with wave.open(str(path), "rb") as w:
+        return w.getnframes() / float(w.getframerate() or 1)
+
+
+def _segments(result: dict) -> List[Tuple[float, float, str, float]]:
+    """Raw Whisper segments as (start, end, text, avg_logprob)."""
+    return [
+        (float(seg.get("start", 0.0)), float(seg.get("end", 0.0)),
+         seg.get("text", "").strip(), float(seg.get("avg_logprob", 0.0)))
+        for seg in result.get("segments", [])
+    ]
+
+
+# ----------------------------------------------------------------------
+# Parallel chunked decoding for long stems
+# ----------------------------------------------------------------------
+def _read_wav(path: Path):
+    """Return the 16-bit PCM *path* as float32 mono samples."""
+    import numpy as np
+    with wave.open(str(path), "rb") as w:
+        pcm = w.readframes(w.getnframes())
+    return np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0
+
+
+def _silence_cuts(audio, sr: int = SAMPLE_RATE) -> List[int]:
+    """Sample indices splitting *audio* into ~CHUNK_SECONDS pieces at its
+    quietest 100 ms frame near each target boundary."""
+    import numpy as np
+    hop = sr // 10
+    n_frames = len(audio) // hop
+    if n_frames == 0:
+        return [0, len(audio)]
+    frames = audio[: n_frames * hop].reshape(n_frames, hop)
+    energy = np.sqrt(np.mean(np.square(frames), axis=1))
+
+    cuts = [0]
+    target = CHUNK_SECONDS
+    total = len(audio) / sr
+    while target < total - CHUNK_SECONDS / 2:
+        lo = max(int((target - CHUNK_SEARCH) * 10), cuts[-1] // hop + 1)
+        hi = min(int((target + CHUNK_SEARCH) * 10), n_frames)
+        if lo >= hi:
+            break
+        quiet = lo + int(np.argmin(energy[lo:hi]))
+        cuts.append(quiet * hop + hop // 2)
+        target = cuts[-1] / sr + CHUNK_SECONDS
+    cuts.append(len(audio))
+    return cuts
+
+
+_WORKER_MODEL = None
+
+
+def _init_worker(model_size: str, quantize: bool, threads: int) -> None:
+    global _WORKER_MODEL
+    import torch
+    torch.set_num_threads(threads)
+    _WORKER_MODEL = _load_model(model_size, quantize)
+
+
+def _transcribe_chunk(audio, options: dict) -> List[Tuple[float, float, str, float]]:
+    return _segments(_WORKER_MODEL.transcribe(audio, **options))
+
+
+def _merge_chunks(
+        spans: List[Tuple[float, float, float]],
+        results: List[List[Tuple[float, float, str, float]]],
+) -> List[Tuple[float, float, str, float]]:
+    """Shift chunk-local segments to global time and de-duplicate.
+
+    *spans* holds (offset, own_from, own_to) per chunk: a segment is kept by
+    the chunk whose owned range contains its midpoint, so anything decoded
+    twice in the padding shared with a neighbour survives exactly once.
+    """
+    merged: List[Tuple[float, float, str, float]] = []
+    for (offset, own_from, own_to), segs in zip(spans, results):
+        for start, end, text, conf in segs:
+            start, end = start + offset, end + offset
+            if own_from <= (start + end) / 2 < own_to:
+                merged.append((start, end, text, conf))
+    merged.sort(key=lambda s: s[0])
+
+    out: List[Tuple[float, float, str, float]] = []
+    for seg in merged:
+        if out:
+            overlap = out[-1][1] - seg[0]
+            if overlap > 0 and (seg[2] == out[-1][2]
+                                or overlap > 0.5 * max(seg[1] - seg[0], 1e-6)):
+                # same words re-emitted across the boundary: keep the copy
+                # that wasn't cut short by the chunk edge
+                if seg[1] - seg[0] > out[-1][1] - out[-1][0]:
+                    out[-1] = seg
+                continue
+        out.append(seg)
+    return out
+
+
+def _transcribe_parallel(
+        decoded: Path, workers: int, model_size: str, quantize: bool, options: dict,
+) -> List[Tuple[float, float, str, float]]:
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    audio = _read_wav(decoded)
+    cuts = _silence_cuts(audio)
+    pad = int(CHUNK_PAD * SAMPLE_RATE)
+
+    chunks, spans = [], []
+    for a, b in zip(cuts, cuts[1:]):
+        lo, hi = max(0, a - pad), min(len(audio), b + pad)
+        chunks.append(audio[lo:hi])
+        spans.append((lo / SAMPLE_RATE, a / SAMPLE_RATE, b / SAMPLE_RATE))
+    spans[-1] = (spans[-1][0], spans[-1][1], float("inf"))
+
+    workers = pool_size(min(workers, len(chunks)))
+    threads = worker_threads(workers)
+    print(f"[Whisper] {len(chunks)} chunks across {workers} workers")
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(model_size, quantize, threads),
+    ) as pool:
+        results = list(pool.map(_transcribe_chunk, chunks, [options] * len(chunks)))
+    return _merge_chunks(spans, results)
+
 
 def _spellcheck_line(text: str) -> str:
     """Return the text with simple spelling corrections applied."""
@@ -50,17 +265,45 @@ for getter, canon in (
                 shutil.copy2(_exe, target) # fallback on filesystems w/o symlink
 
 
-def transcribe(vocal_path: str, work_dir: str) -> List[Tuple[float, float, str, float]]:
+def transcribe(
+        vocal_path: str, work_dir: str, *,
+        model_size: Optional[str] = None,
+        quantize: Optional[bool] = None,
+        language: Optional[str] = None,
+        greedy: Optional[bool] = None,
+        workers: Optional[int] = None,
+) -> List[Tuple[float, float, str, float]]:
     """Transcribe the given vocal stem using Whisper.
     Returns a list of tuples of (start_time, end_time, text, confidence).
+
+    ``model_size``, ``quantize`` (int8 dynamic quantization, CPU only),
+    ``language`` (pinned language, skips detection) and ``greedy``
+    (temperature 0 without fallback) default to the ``UCR_WHISPER_*``
+    environment variables, then to the historical settings.
+
+    With ``workers`` > 1 (or ``UCR_WHISPER_WORKERS``) a long stem is cut at
+    silences and the chunks are decoded across a process pool.
     """
-    model = whisper.load_model("base")
+    model_size, quantize = resolve_model(model_size, quantize)
+    language = language or os.environ.get(_LANGUAGE_ENV) or None
+    greedy = _env_flag(_GREEDY_ENV) if greedy is None else greedy
+
+    workers = int(os.environ.get(_WORKERS_ENV, "1")) if workers is None else workers
+
+    options: dict = {}
+    if quantize:
+        options["fp16"] = False
+    if language:
+        options["language"] = language
+    if greedy:
+        options.update(temperature=0.0, beam_size=None, best_of=None)
 
     decoded = Path(work_dir) / "decoded.wav"
     try:
         subprocess.run([
             "ffmpeg",
             "-y",
+            *ffmpeg_threads(),
             "-i",
             vocal_path,
             "-ar",
@@ -69,24 +312,41 @@ def transcribe(vocal_path: str, work_dir: str) -> List[Tuple[float, float, str,
             "1",
             str(decoded),
         ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
-        result = model.transcribe(str(decoded))
+        audio_s = _wav_seconds(decoded)
+        t0 = time.perf_counter()
+        if workers > 1 and audio_s >= 2 * CHUNK_SECONDS:
+            segments = _transcribe_parallel(
+                decoded, workers, model_size, quantize, options
+            )
+        else:
+            workers = 1
+            model = _load_model(model_size, quantize)
+            with _DECODE_LOCKS[(model_size, quantize)]:
+                segments = _segments(model.transcribe(str(decoded), **options))
+        elapsed = time.perf_counter() - t0
+        backend = "/".join([
+            model_size, "int8" if quantize else "fp32",
+            language or "auto", "greedy" if greedy else "fallback",
+        ])
+        if workers > 1:
+            backend += f" ×{workers}"
+        rtf = elapsed / audio_s if audio_s else float("nan")
+        print(f"[Whisper] {backend}  RTF {rtf:.2f} ({elapsed:.1f}s for {audio_s:.1f}s audio)")
     finally:
         decoded.exists() and decoded.unlink()
 
     lines = []
-    for seg in result.get("segments", []):
-        start = float(seg.get("start", 0.0))
-        end = float(seg.get("end", 0.0))
-        text = seg.get("text", "").strip()
-        conf = float(seg.get("avg_logprob", 0.0))
-
+    for start, end, text, conf in segments:
         prob = math.exp(conf)
+        metrics.inc("ucr_lyric_lines_total")
         if prob < 0.15:
             text = "???"
+            metrics.inc("ucr_lyric_lines_low_confidence_total", level="unreadable")
         else:
             text = _spellcheck_line(text)
             if prob < 0.5:
                 text += " (???)"
+                metrics.inc("ucr_lyric_lines_low_confidence_total", level="uncertain")
 
         lines.append((start, end, text, conf))
     return lines
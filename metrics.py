@@ -0,0 +1,180 @@
+"""Prometheus textfile metrics for long batch runs.
+
+Counters and histograms live in one in-process registry. When a metrics
+file is configured (``--metrics-file`` / ``UCR_METRICS_FILE``), the registry
+is rewritten atomically at every stage boundary and after every track, so
+node_exporter's textfile collector can scrape progress while a catalogue is
+still being processed.
+"""
+
+from __future__ import annotations
+
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+_FILE_ENV = "UCR_METRICS_FILE"
+
+DURATION_BUCKETS   = (1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+RTF_BUCKETS        = (0.1, 0.25, 0.5, 1, 2, 4, 8, 16)
+SIMILARITY_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+
+# name → (type, help, buckets)
+METRICS: Dict[str, Tuple[str, str, Tuple[float, ...]]] = {
+    "ucr_stage_duration_seconds": (
+        "histogram", "Wall time per pipeline stage.", DURATION_BUCKETS),
+    "ucr_track_realtime_factor": (
+        "histogram", "Processing time divided by audio duration, per track.", RTF_BUCKETS),
+    "ucr_tracks_total": (
+        "counter", "Tracks processed, by outcome.", ()),
+    "ucr_failures_total": (
+        "counter", "Failures by pipeline stage.", ()),
+    "ucr_bpm_source_total": (
+        "counter", "Which BPM fallback produced the tempo.", ()),
+    "ucr_separation_backend_total": (
+        "counter", "Separation backend chosen by separate_and_score.", ()),
+    "ucr_separation_similarity": (
+        "histogram", "Instrumental similarity score from separate_and_score.", SIMILARITY_BUCKETS),
+    "ucr_lyric_lines_total": (
+        "counter", "Lyric lines transcribed by Whisper.", ()),
+    "ucr_lyric_lines_low_confidence_total": (
+        "counter", "Lyric lines below the confidence thresholds, by level.", ()),
+    "ucr_last_refresh_timestamp_seconds": (
+        "gauge", "Unix time this file was written.", ()),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Registry:
+    """Minimal counter/histogram store rendering the Prometheus text format.
+    Safe to share between the threads of an AnalysisSession."""
+
+    def __init__(self) -> None:
+        self.values: Dict[Tuple[str, Labels], float] = {}
+        self.histograms: Dict[Tuple[str, Labels], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def snapshot(self) -> tuple:
+        """Picklable copy, for shipping a worker's metrics to the parent."""
+        with self._lock:
+            return dict(self.values), {k: list(v) for k, v in self.histograms.items()}
+
+    def merge(self, snapshot: tuple) -> None:
+        values, histograms = snapshot
+        with self._lock:
+            for key, v in values.items():
+                if key[0] == "ucr_last_refresh_timestamp_seconds":
+                    continue
+                self.values[key] = self.values.get(key, 0.0) + v
+            for key, h in histograms.items():
+                mine = self.histograms.setdefault(key, [0.0] * len(h))
+                for i, n in enumerate(h):
+                    mine[i] += n
+
+    def inc(self, name: str, value: float = 1.0, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.values[key] = self.values.get(key, 0.0) + value
+
+    def set(self, name: str, value: float, **labels: str) -> None:
+        with self._lock:
+            self.values[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        buckets = METRICS[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            # per-bucket counts, then sum and count
+            h = self.histograms.setdefault(key, [0.0] * (len(buckets) + 2))
+            for i, le in enumerate(buckets):
+                if value <= le:
+                    h[i] += 1
+            h[-2] += value
+            h[-1] += 1
+
+    def render(self) -> str:
+        values, histograms = self.snapshot()
+        out: List[str] = []
+        for name, (kind, help_, buckets) in METRICS.items():
+            series = [(k, v) for k, v in values.items() if k[0] == name]
+            hists = [(k, v) for k, v in histograms.items() if k[0] == name]
+            if not series and not hists:
+                continue
+            out += [f"# HELP {name} {help_}", f"# TYPE {name} {kind}"]
+            for (_n, labels), v in sorted(series):
+                out.append(f"{name}{_fmt(labels)} {_num(v)}")
+            for (_n, labels), h in sorted(hists):
+                for le, n in zip(buckets, h):
+                    out.append(f"{name}_bucket{_fmt(labels + (('le', _num(le)),))} {_num(n)}")
+                out.append(f"{name}_bucket{_fmt(labels + (('le', '+Inf'),))} {_num(h[-1])}")
+                out.append(f"{name}_sum{_fmt(labels)} {_num(h[-2])}")
+                out.append(f"{name}_count{_fmt(labels)} {_num(h[-1])}")
+        return "\n".join(out) + "\n"
+
+    def write(self, path: Path) -> None:
+        """Atomically replace *path* (temp file in the same dir + rename).
+        Each call gets its own temp file, so threads may flush concurrently."""
+        self.set("ucr_last_refresh_timestamp_seconds", time.time())
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as fh:
+                fh.write(self.render())
+            os.chmod(tmp, 0o644)      # mkstemp's 0600 would hide it from node_exporter
+            os.replace(tmp, path)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels) + "}"
+
+
+def _num(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+
+REGISTRY = Registry()
+inc = REGISTRY.inc
+observe = REGISTRY.observe
+
+def flush(path: Optional[str] = None) -> None:
+    """Write the textfile if a destination is configured; never raises."""
+    target = path or os.environ.get(_FILE_ENV)
+    if not target:
+        return
+    try:
+        REGISTRY.write(Path(target))
+    except OSError as exc:
+        print(f"[Metrics] could not write {target} ({exc})")
+
+
+@contextmanager
+def stage(name: str, timings: Optional[Dict[str, float]] = None) -> Iterator[None]:
+    """Time a pipeline stage; count it as a failure if it raises. The wall
+    time is also added to *timings* (the caller's per-track dict), which
+    the batch scheduler uses to calibrate its cost model."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        inc("ucr_failures_total", stage=name)
+        raise
+    finally:
+        elapsed = time.perf_counter() - t0
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + elapsed
+        observe("ucr_stage_duration_seconds", elapsed, stage=name)
+        flush()
@@ -6,17 +6,24 @@ Order of attempts
 2.  CLI via **python -m demucs.separate**  (works even if `demucs` isn’t on $PATH)
 3.  CLI via **demucs** binary on $PATH     (final fallback)
 
+With ``jobs`` > 1 the API path cuts a long track into overlapping windows,
+separates them in a process pool and crossfades the results back together.
+With ``stream`` it instead walks the track segment by segment and appends
+each stem (and the no_vocals mix) to its file, so peak memory depends on
+the segment length rather than the track length.
+
 Returns
 -------
 Tuple[Path, Path]  →  (vocal_stem, instrumental_stem)
 """
 from __future__ import annotations
 
+import os
 import sys
 import shutil
 import subprocess
 from pathlib import Path
-from typing import Tuple
+from typing import List, Optional, Tuple
 
 # ----------------------------------------------------------------------
 # Try to import the Python API. If anything fails we’ll drop to the CLI.
@@ -31,22 +38,236 @@ except Exception as exc:  # pragma: no cover
     apply_model = get_model = AudioFile = save_audio = None  # type: ignore
 
 
+_JOBS_ENV        = "UCR_DEMUCS_JOBS"   # >1 → segmented multi-process separation
+SEGMENT_SECONDS  = 60.0                # window length per worker task
+SEGMENT_OVERLAP  = 5.0                 # crossfade length between windows
+_STREAM_ENV      = "UCR_DEMUCS_STREAM"  # "1" → memory-bounded streaming mode
+STREAM_SECONDS   = 30.0                # segment length in streaming mode
+
+
 # ----------------------------------------------------------------------
 # Helpers
 # ----------------------------------------------------------------------
 def _run(cmd: list[str]) -> None:
     """Run *cmd* and re-raise failures as RuntimeError."""
+    from resources import subprocess_env
     try:
-        subprocess.run(cmd, check=True)
+        subprocess.run(cmd, check=True, env=subprocess_env())
     except (FileNotFoundError, subprocess.CalledProcessError) as exc:
         raise RuntimeError("Demucs CLI failed") from exc
 
 
+def _windows(length: int, size: int, overlap: int) -> List[Tuple[int, int]]:
+    """(start, stop) sample ranges of *size* covering *length*, sharing *overlap*."""
+    if length <= size:
+        return [(0, length)]
+    # full-size windows only; the last one is pulled back to end at *length*
+    starts = list(range(0, length - size, size - overlap)) + [length - size]
+    return [(a, a + size) for a in starts]
+
+
+def _fade(n: int, fade_in: int, fade_out: int):
+    """Linear crossfade weights for one window (never exactly zero)."""
+    import numpy as np
+    w = np.ones(n, dtype=np.float32)
+    if fade_in:
+        w[:fade_in] = np.linspace(0.0, 1.0, fade_in + 2, dtype=np.float32)[1:-1]
+    if fade_out:
+        w[n - fade_out:] = np.linspace(1.0, 0.0, fade_out + 2, dtype=np.float32)[1:-1]
+    return w
+
+
+_MODELS: dict = {}
+
+
+def load_model(model: str):
+    """Return a cached, eval-mode Demucs model (kept warm across tracks)."""
+    if model not in _MODELS:
+        _MODELS[model] = get_model(model)
+        _MODELS[model].eval()
+    return _MODELS[model]
+
+
+_WORKER_MODEL = None
+
+
+def _init_worker(model: str, threads: int) -> None:
+    global _WORKER_MODEL
+    import torch
+    torch.set_num_threads(threads)
+    _WORKER_MODEL = load_model(model)
+
+
+def _separate_window(chunk):
+    """Worker task: separate one (channels, samples) float32 window."""
+    import torch
+    with torch.no_grad():
+        out = apply_model(
+            _WORKER_MODEL, torch.from_numpy(chunk)[None],
+            split=True, overlap=0.25, progress=False,
+        )[0]
+    return out.numpy()
+
+
+def _apply_segmented(wav, model: str, samplerate: int, jobs: int):
+    """Separate normalised *wav* (channels, samples) window by window across
+    *jobs* processes, crossfading the overlaps. Returns a sources tensor
+    shaped like ``apply_model(...)[0]``."""
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    import numpy as np
+    import torch
+    from resources import pool_size, worker_threads
+
+    audio = wav.cpu().numpy().astype(np.float32, copy=False)
+    length = audio.shape[-1]
+    size = int(SEGMENT_SECONDS * samplerate)
+    overlap = int(SEGMENT_OVERLAP * samplerate)
+    spans = _windows(length, size, overlap)
+
+    jobs = pool_size(min(jobs, len(spans)))
+    threads = worker_threads(jobs)
+    print(f"[Demucs] {len(spans)} windows across {jobs} workers × {threads} threads")
+
+    with ProcessPoolExecutor(
+        max_workers=jobs,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(model, threads),
+    ) as pool:
+        chunks = (np.ascontiguousarray(audio[:, a:b]) for a, b in spans)
+        out = _overlap_add(spans, pool.map(_separate_window, chunks), length, overlap)
+    return torch.from_numpy(out)
+
+
+def _overlap_add(spans: List[Tuple[int, int]], pieces, length: int, overlap: int):
+    """Crossfade the separated window *pieces* (``(..., b - a)`` arrays, in
+    *spans* order) back into one ``(..., length)`` float32 array."""
+    import numpy as np
+
+    out = weight = None
+    for i, ((a, b), src) in enumerate(zip(spans, pieces)):
+        if out is None:
+            out = np.zeros(src.shape[:-1] + (length,), dtype=np.float32)
+            weight = np.zeros(length, dtype=np.float32)
+        w = _fade(b - a,
+                  overlap if i > 0 else 0,
+                  overlap if i < len(spans) - 1 else 0)
+        out[..., a:b] += src * w
+        weight[a:b] += w
+    out /= weight
+    return out
+
+
+# ----------------------------------------------------------------------
+# Streaming separation – bounded memory for very long inputs
+# ----------------------------------------------------------------------
+def _stream_separate(input_path: Path, stems_dir: Path, demucs_model,
+                     *, segment: float = STREAM_SECONDS,
+                     overlap: float = SEGMENT_OVERLAP) -> None:
+    """Separate *input_path* into ``stems_dir/<name>.wav`` plus
+    ``no_vocals.wav`` one segment at a time.
+
+    The input is decoded once to a float32 wav on disk; a first pass
+    collects the normalisation statistics, a second pass separates
+    overlapping segments, crossfades each overlap with the previous
+    segment's tail and appends the result to every sink.
+    """
+    import numpy as np
+    import soundfile as sf
+    import torch
+    from resources import ffmpeg_threads
+    from ultimate_chord_reader import overwrite_and_remove
+
+    sr, channels = demucs_model.samplerate, demucs_model.audio_channels
+    names = list(demucs_model.sources)
+    decoded = stems_dir / "_input.wav"
+    _run_quiet([
+        "ffmpeg", "-y", *ffmpeg_threads(), "-i", str(input_path),
+        "-ar", str(sr), "-ac", str(channels), "-c:a", "pcm_f32le", str(decoded),
+    ])
+
+    sinks: dict = {}
+    try:
+        with sf.SoundFile(str(decoded)) as src:
+            length = src.frames
+            total = sq = 0.0
+            for block in src.blocks(blocksize=sr * 10, dtype="float32", always_2d=True):
+                mono = block.mean(axis=1)
+                total += float(mono.sum(dtype=np.float64))
+                sq += float(np.dot(mono, mono))
+            mean = total / max(length, 1)
+            std = float(np.sqrt(max(sq / max(length, 1) - mean * mean, 1e-12)))
+
+            for name in names + ["no_vocals"]:
+                sinks[name] = sf.SoundFile(str(stems_dir / f"{name}.wav"), "w",
+                                           samplerate=sr, channels=channels,
+                                           subtype="PCM_16")
+            other = [i for i, n in enumerate(names) if n != "vocals"]
+
+            size, ov = int(segment * sr), int(overlap * sr)
+            tail = None
+            start = 0
+            while True:
+                stop = min(start + size, length)
+                src.seek(start)
+                chunk = src.read(stop - start, dtype="float32", always_2d=True).T
+                chunk = (chunk - mean) / std
+                with torch.no_grad():
+                    out = apply_model(
+                        demucs_model, torch.from_numpy(np.ascontiguousarray(chunk))[None],
+                        split=True, overlap=0.25, progress=False,
+                    )[0].numpy()
+                out = out * std + mean
+
+                if tail is not None:
+                    n = tail.shape[-1]
+                    ramp = np.linspace(0.0, 1.0, n + 2, dtype=np.float32)[1:-1]
+                    out[..., :n] = tail * (1.0 - ramp) + out[..., :n] * ramp
+
+                last = stop >= length
+                keep = 0 if last else min(ov, out.shape[-1])
+                ready, tail = out[..., :out.shape[-1] - keep], (None if last else out[..., -keep:])
+                for i, name in enumerate(names):
+                    sinks[name].write(np.clip(ready[i].T, -1.0, 1.0))
+                sinks["no_vocals"].write(np.clip(ready[other].sum(axis=0).T, -1.0, 1.0))
+
+                if last:
+                    break
+                start = stop - keep
+    finally:
+        for sink in sinks.values():
+            sink.close()
+        overwrite_and_remove(decoded)
+
+
+def _run_quiet(cmd: list[str]) -> None:
+    try:
+        subprocess.run(cmd, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except (FileNotFoundError, subprocess.CalledProcessError) as exc:
+        raise RuntimeError(f"{cmd[0]} failed") from exc
+
+
 # ----------------------------------------------------------------------
 # Main public entry-point
 # ----------------------------------------------------------------------
-def run_demucs(input_path: str, output_dir: str, *, model: str = "htdemucs") -> Tuple[Path, Path]:
-    """Return (vocal_stem, instrumental_stem) for *input_path* using *model*."""
+def run_demucs(
+    input_path: str, output_dir: str, *, model: str = "htdemucs",
+    jobs: Optional[int] = None, stream: Optional[bool] = None,
+    segment: Optional[float] = None,
+) -> Tuple[Path, Path]:
+    """Return (vocal_stem, instrumental_stem) for *input_path* using *model*.
+
+    *jobs* (default ``UCR_DEMUCS_JOBS`` or 1) > 1 enables segmented
+    multi-process separation on the Python-API path; *stream* (default
+    ``UCR_DEMUCS_STREAM``) enables memory-bounded streaming separation
+    in *segment*-second pieces (default STREAM_SECONDS) and never falls
+    back to the CLI, which would hold the whole track in memory.
+    """
+    jobs = int(os.environ.get(_JOBS_ENV, "1")) if jobs is None else jobs
+    if stream is None:
+        stream = os.environ.get(_STREAM_ENV, "").strip().lower() in {"1", "true", "yes", "on"}
     out_root = Path(output_dir).expanduser().resolve()
     out_root.mkdir(parents=True, exist_ok=True)
 
@@ -56,7 +277,20 @@ def run_demucs(input_path: str, output_dir: str, *, model: str = "htdemucs") ->
         assert apply_model and get_model and AudioFile and save_audio
 
         try:
-            demucs_model = get_model(model)
+            demucs_model = load_model(model)
+            stems_dir = out_root / Path(input_path).stem
+            stems_dir.mkdir(exist_ok=True)
+
+            if stream:
+                _stream_separate(Path(input_path), stems_dir, demucs_model,
+                                 segment=segment or STREAM_SECONDS)
+                vocal = stems_dir / "vocals.wav"
+                inst  = stems_dir / "no_vocals.wav"
+                if vocal.exists() and inst.exists():
+                    print("[Demucs] Separated with Python API (streaming)")
+                    return vocal, inst
+                raise RuntimeError("Demucs streaming produced no stems")
+
             wav = AudioFile(Path(input_path)).read(          # cast to Path
                 streams=0,                                   # type: ignore[arg-type]
                 samplerate=demucs_model.samplerate,
@@ -65,13 +299,15 @@ def run_demucs(input_path: str, output_dir: str, *, model: str = "htdemucs") ->
             ref = wav.mean(0)
             wav = (wav - ref.mean()) / ref.std()
 
-            sources = apply_model(
-                demucs_model, wav[None], split=True, overlap=0.25, progress=False
-            )[0]
+            seg_len = int(SEGMENT_SECONDS * demucs_model.samplerate)
+            if jobs > 1 and wav.shape[-1] > 2 * seg_len:
+                sources = _apply_segmented(wav, model, demucs_model.samplerate, jobs)
+            else:
+                sources = apply_model(
+                    demucs_model, wav[None], split=True, overlap=0.25, progress=False
+                )[0]
             sources = sources * ref.std() + ref.mean()
 
-            stems_dir = out_root / Path(input_path).stem
-            stems_dir.mkdir(exist_ok=True)
             names = demucs_model.sources
             for source, name in zip(sources, names):
                 save_audio(source, stems_dir / f"{name}.wav", demucs_model.samplerate)
@@ -91,8 +327,16 @@ def run_demucs(input_path: str, output_dir: str, *, model: str = "htdemucs") ->
             raise RuntimeError("Demucs API produced no stems")
 
         except Exception as exc:
+            if stream:
+                raise RuntimeError(f"Demucs streaming failed ({exc})") from exc
             print(f"[Demucs] API failed ({exc}); switching to CLI.")
 
+    if stream:
+        # the CLI separates the whole track in memory – exactly what
+        # streaming (often chosen by the memory governor) must avoid
+        raise RuntimeError("streaming separation needs the Demucs Python API; "
+                           "refusing to fall back to the full-track CLI")
+
     # 2) ---------- CLI via python -m demucs.separate -------------------
     cli_cmd = [
         sys.executable, "-m", "demucs.separate",
@@ -132,16 +376,23 @@ def run_demucs(input_path: str, output_dir: str, *, model: str = "htdemucs") ->
         others = [p for p in wav_files if p is not vocal and "vocals" not in p.name.lower()]
         if others:
             import soundfile as sf
-            import numpy as np
-            data = []
-            sr = None
-            for p in others:
-                d, sr = sf.read(str(p))
-                data.append(d)
-            min_len = min(len(d) for d in data)
-            mix = sum(d[:min_len] for d in data) / max(len(data), 1)
-            inst = vocal.with_name("no_vocals.wav")
-            sf.write(str(inst), mix, sr)
+            # float32, block by block: never holds a full-length stem
+            srcs = [sf.SoundFile(str(p)) for p in others]
+            try:
+                min_len = min(s.frames for s in srcs)
+                inst = vocal.with_name("no_vocals.wav")
+                with sf.SoundFile(str(inst), "w", samplerate=srcs[0].samplerate,
+                                  channels=srcs[0].channels, subtype="PCM_16") as out:
+                    for start in range(0, min_len, 1 << 18):
+                        n = min(1 << 18, min_len - start)
+                        mix = srcs[0].read(n, dtype="float32", always_2d=True)
+                        for s in srcs[1:]:
+                            mix += s.read(n, dtype="float32", always_2d=True)
+                        mix /= len(srcs)
+                        out.write(mix)
+            finally:
+                for s in srcs:
+                    s.close()
 
     if vocal is None or inst is None:
         raise RuntimeError("Couldn’t find expected stems in Demucs output")
@@ -23,13 +23,21 @@ def _find_stem(directory: Path, key: str) -> Optional[Path]:
     return None
 
 
+def find_uvr() -> Optional[str]:
+    """Return the path to ``uvr.py`` or None if UVR isn't installed."""
+    uvr_exe = os.environ.get("UVR_PY") or shutil.which("uvr.py")
+    if not uvr_exe or not Path(uvr_exe).exists():
+        return None
+    return uvr_exe
+
+
 def run_uvr(input_path: str, output_dir: str) -> Tuple[Path, Path]:
     """Run UVR via subprocess and return paths to vocal and instrumental stems."""
     output = Path(output_dir)
     output.mkdir(parents=True, exist_ok=True)
 
-    uvr_exe = os.environ.get("UVR_PY") or shutil.which("uvr.py")
-    if not uvr_exe or not Path(uvr_exe).exists():
+    uvr_exe = find_uvr()
+    if not uvr_exe:
         raise FileNotFoundError(
             "uvr.py not found. Install Ultimate Vocal Remover or set the UVR_PY environment variable."
         )
@@ -44,8 +52,9 @@ def run_uvr(input_path: str, output_dir: str) -> Tuple[Path, Path]:
         "--model",
         "UVR-MDX",
     ]
+    from resources import subprocess_env
     try:
-        subprocess.run(cmd, check=True)
+        subprocess.run(cmd, check=True, env=subprocess_env())
     except (FileNotFoundError, CalledProcessError) as exc:
         raise RuntimeError("UVR execution failed") from exc
 
@@ -5,27 +5,44 @@ Flow
 1. Try Demucs (preferred baseline).
 2. If Demucs fails, try UVR.
 3. If both succeed, compare instrumental RMS and choose the closer pair.
+
+Probe mode (``probe=True`` / ``UCR_SEPARATION_PROBE=1``) applies the same
+rule to a few short excerpts first and then runs only the winning backend
+on the full track.
 """
 from __future__ import annotations
 
 import shutil
 import os
+import subprocess
+import time
 from pathlib import Path
-from typing import Tuple
+from typing import Optional, Tuple
 
 import numpy as np
 import soundfile as sf
 
-from .mvsep_loader import run_uvr
+from .mvsep_loader import find_uvr, run_uvr
 from .demucs_loader import run_demucs
+from .weights import configure as configure_weights
 
-os.environ.setdefault("TORCH_HOME", "/tmp")
+configure_weights()                # weights → persistent store (never audio)
 os.environ.setdefault("XDG_CACHE_HOME", "/tmp")
 
+_PROBE_ENV          = "UCR_SEPARATION_PROBE"
+_PROBE_EXCERPTS_ENV = "UCR_PROBE_EXCERPTS"
+_PROBE_SECONDS_ENV  = "UCR_PROBE_SECONDS"
+PROBE_EXCERPTS      = 2
+PROBE_SECONDS       = 25.0
+
 
 def _rms(path: Path) -> float:
-    data, _ = sf.read(str(path))
-    return float(np.sqrt(np.mean(np.square(data))))
+    total, count = 0.0, 0
+    for block in sf.blocks(str(path), blocksize=1 << 18, dtype="float32"):
+        flat = block.reshape(-1)
+        total += float(np.dot(flat, flat))
+        count += flat.size
+    return float(np.sqrt(total / max(count, 1)))
 
 
 def _similarity(inst1: Path, inst2: Path) -> float:
@@ -35,40 +52,162 @@ def _similarity(inst1: Path, inst2: Path) -> float:
     return 1.0 - abs(rms1 - rms2) / max(rms1, rms2, 1e-6)
 
 
-def separate_and_score(input_path: str, work_dir: str) -> Tuple[Path, Path, float]:
-    """Separate the given track into vocals/instrumental using a temporary folder."""
+def _choose(score: float, have_demucs: bool, have_uvr: bool) -> str:
+    """The historical decision rule: UVR only when it agrees with Demucs."""
+    if not have_demucs:
+        if not have_uvr:
+            raise RuntimeError("No separation method available")
+        return "uvr"
+    return "uvr" if have_uvr and score >= 0.5 else "demucs"
+
+
+def _excerpt(src: str, dst: Path, start: float, length: float) -> Path:
+    from resources import ffmpeg_threads
+    subprocess.run(
+        ["ffmpeg", "-y", *ffmpeg_threads(), "-ss", f"{start:.3f}", "-t", f"{length:.3f}",
+         "-i", src, "-c:a", "pcm_s16le", str(dst)],
+        check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    return dst
+
+
+def _probe(input_path: str, probe_dir: Path, count: int, length: float) -> Tuple[str, Optional[float]]:
+    """Run both backends on *count* excerpts of *length* seconds and return
+    (winning backend, mean instrumental similarity), the similarity being
+    None when no excerpt was separated by both."""
+    from audio_probe import duration
+
+    if find_uvr() is None:
+        # nothing to compare against: the excerpts would only cost time
+        print("[Separation] UVR not installed; probe skipped, using Demucs")
+        return "demucs", None
+
+    total = duration(input_path)
+    if total <= 0 or total <= length:
+        starts = [0.0]
+    else:
+        # evenly spaced, centred excerpts – skips intros and outros
+        starts = [max(0.0, min(total - length, (k + 1) * total / (count + 1) - length / 2))
+                  for k in range(count)]
+
+    have_uvr = True
+    have_demucs = False
+    scores = []
+    for k, start in enumerate(starts):
+        d = probe_dir / f"excerpt{k}"
+        d.mkdir(parents=True, exist_ok=True)
+        clip = _excerpt(input_path, d / "clip.wav", start, length)
+        inst_d = inst_u = None
+        try:
+            _v, inst_d = run_demucs(str(clip), str(d / "demucs"), model="htdemucs_6s",
+                                    jobs=1, stream=False)
+            have_demucs = True
+        except (FileNotFoundError, RuntimeError) as exc:
+            print(f"[Demucs] probe failed → {exc}")
+        if have_uvr:
+            try:
+                _v, inst_u = run_uvr(str(clip), str(d / "uvr"))
+            except (FileNotFoundError, RuntimeError):
+                have_uvr = False
+        if inst_d is not None and inst_u is not None:
+            scores.append(_similarity(inst_u, inst_d))
+
+    if not scores:
+        return _choose(0.0, have_demucs, have_uvr), None
+    score = float(np.mean(scores))
+    return _choose(score, have_demucs, have_uvr), score
+
+
+def separate_and_score(
+    input_path: str, work_dir: str, *,
+    jobs: Optional[int] = None, stream: Optional[bool] = None,
+    segment: Optional[float] = None, probe: Optional[bool] = None, probe_excerpts: Optional[int] = None,
+    probe_seconds: Optional[float] = None,
+) -> Tuple[Path, Path, float]:
+    """Separate the given track into vocals/instrumental using a temporary folder.
+
+    *jobs*, *stream* and *segment* are forwarded to :func:`run_demucs`
+    (segmented multi-process mode / memory-bounded streaming mode); a
+    streamed track is separated by Demucs alone.  With *probe* the
+    backend is picked on *probe_excerpts* excerpts of *probe_seconds* each
+    (defaults: ``UCR_PROBE_EXCERPTS`` / ``UCR_PROBE_SECONDS``) and only the
+    winner separates the full track.
+    """
+    if probe is None:
+        probe = os.environ.get(_PROBE_ENV, "").strip().lower() in {"1", "true", "yes", "on"}
+    if stream is None:
+        stream = os.environ.get("UCR_DEMUCS_STREAM", "").strip().lower() in {"1", "true", "yes", "on"}
     tempdir = Path(work_dir)
     uvr_dir, demucs_dir = tempdir / "uvr", tempdir / "demucs"
     uvr_dir.mkdir(parents=True, exist_ok=True)
     demucs_dir.mkdir(parents=True, exist_ok=True)
 
-    try:
-        vocal_demucs, inst_demucs = run_demucs(input_path, str(demucs_dir), model="htdemucs_6s")
-    except (FileNotFoundError, RuntimeError) as exc:
-        print(f"[Demucs] unavailable → {exc}")
-        vocal_demucs = inst_demucs = None
-
-    try:
-        vocal_uvr, inst_uvr = run_uvr(input_path, str(uvr_dir))
-    except (FileNotFoundError, RuntimeError):
-        vocal_uvr = inst_uvr = None
-
-    # Decide which set to return
+    backends = {"demucs", "uvr"}
+    probe_score: Optional[float] = None
+    if stream:
+        # UVR separates the whole track in memory; streaming is Demucs-only
+        print("[Separation] streaming: Demucs only, UVR and probe skipped")
+        backends, probe = {"demucs"}, False
+    elif probe:
+        count = probe_excerpts or int(os.environ.get(_PROBE_EXCERPTS_ENV, PROBE_EXCERPTS))
+        length = probe_seconds or float(os.environ.get(_PROBE_SECONDS_ENV, PROBE_SECONDS))
+        probe_dir = tempdir / "probe"
+        t0 = time.perf_counter()
+        try:
+            winner, probe_score = _probe(input_path, probe_dir, max(1, count), length)
+        except (OSError, RuntimeError, subprocess.CalledProcessError) as exc:
+            # a failed probe says nothing about the full track: run both
+            print(f"[Separation] probe failed ({exc}); trying both backends")
+        else:
+            similarity = "n/a" if probe_score is None else f"{probe_score:.2f}"
+            print(f"[Separation] probe {count}×{length:.0f}s → {winner} "
+                  f"(similarity {similarity}, probe cost {time.perf_counter() - t0:.1f}s)")
+            backends = {winner}
+        finally:
+            shutil.rmtree(probe_dir, ignore_errors=True)
+
+    vocal_demucs = inst_demucs = vocal_uvr = inst_uvr = None
+    fallback = set() if stream else {"demucs", "uvr"} - backends
+    for attempt in (backends, fallback):
+        if "demucs" in attempt:
+            try:
+                vocal_demucs, inst_demucs = run_demucs(
+                    input_path, str(demucs_dir), model="htdemucs_6s",
+                    jobs=jobs, stream=stream, segment=segment,
+                )
+            except (FileNotFoundError, RuntimeError) as exc:
+                print(f"[Demucs] unavailable → {exc}")
+
+        if "uvr" in attempt:
+            try:
+                vocal_uvr, inst_uvr = run_uvr(input_path, str(uvr_dir))
+            except (FileNotFoundError, RuntimeError):
+                pass
+
+        if inst_demucs is not None or inst_uvr is not None:
+            break
+        # only reached when the probe winner failed on the full track
+
+    # Decide which set to return; *compared* is None unless the two
+    # backends were actually scored against each other (full track or probe)
+    compared: Optional[float] = probe_score
     if inst_uvr is not None and inst_demucs is not None:
-        score = _similarity(inst_uvr, inst_demucs)
+        compared = _similarity(inst_uvr, inst_demucs)
+    score = 0.0 if compared is None else compared
+
+    have_demucs = vocal_demucs is not None and inst_demucs is not None
+    have_uvr = vocal_uvr is not None and inst_uvr is not None
+    backend = _choose(score, have_demucs, have_uvr)
+    if backend == "uvr":
+        chosen_v, chosen_i = vocal_uvr, inst_uvr
     else:
-        score = 0.0
+        chosen_v, chosen_i = vocal_demucs, inst_demucs
+    conf = float(score)
 
-    if vocal_demucs is None or inst_demucs is None:
-        if vocal_uvr is None or inst_uvr is None:
-            raise RuntimeError("No separation method available")
-        chosen_v, chosen_i, conf = vocal_uvr, inst_uvr, 0.0
-    else:
-        if score >= 0.5 and vocal_uvr is not None and inst_uvr is not None:
-            chosen_v, chosen_i = vocal_uvr, inst_uvr
-        else:
-            chosen_v, chosen_i = vocal_demucs, inst_demucs
-        conf = float(score)
+    from metrics import inc, observe
+    inc("ucr_separation_backend_total", backend=backend)
+    if compared is not None:
+        observe("ucr_separation_similarity", compared)
 
     # Move selected stems to a stable folder within work_dir
     final_dir = tempdir / "final"
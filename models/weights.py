@@ -0,0 +1,194 @@
+"""Persistent local store for model weights – never audio.
+
+Layout
+------
+<models dir>/torch/hub/checkpoints/*.th   Demucs (via TORCH_HOME, unless already set)
+<models dir>/whisper/*.pt                 Whisper checkpoints
+
+The models dir is ``--models-dir`` / ``UCR_MODELS_DIR``, defaulting to
+``$XDG_DATA_HOME/ultimate_chord_reader/models``.  With ``UCR_OFFLINE=1``
+any attempt to fetch a missing checkpoint fails immediately instead of
+hanging on the network (air-gapped hosts).
+
+Pre-fetch or check the store::
+
+    python -m models.weights --whisper base --demucs htdemucs_6s
+    python -m models.weights --verify          # offline, hashes Whisper files
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import os
+from pathlib import Path
+from typing import List, Optional
+
+_DIR_ENV     = "UCR_MODELS_DIR"
+_OFFLINE_ENV = "UCR_OFFLINE"
+DEFAULT_DIR  = Path(os.environ.get("XDG_DATA_HOME", Path.home() / ".local" / "share")) \
+    / "ultimate_chord_reader" / "models"
+DEFAULT_WHISPER = ["base"]
+DEFAULT_DEMUCS  = ["htdemucs_6s"]
+
+
+def models_dir(override: Optional[str] = None) -> Path:
+    return Path(override or os.environ.get(_DIR_ENV) or DEFAULT_DIR).expanduser()
+
+
+def offline() -> bool:
+    return os.environ.get(_OFFLINE_ENV, "").strip().lower() in {"1", "true", "yes", "on"}
+
+
+def configure(override: Optional[str] = None, *, offline_mode: Optional[bool] = None) -> Path:
+    """Point torch.hub (Demucs) and Whisper at the store; idempotent.
+
+    An existing ``TORCH_HOME`` is kept (Demucs checkpoints stay where
+    torch.hub already has them) unless the store was chosen explicitly
+    with *override* / ``UCR_MODELS_DIR``.
+    """
+    root = models_dir(override)
+    if override or os.environ.get(_DIR_ENV):
+        os.environ[_DIR_ENV] = str(root)           # inherited by spawned workers
+        os.environ["TORCH_HOME"] = str(root / "torch")
+    else:
+        os.environ.setdefault("TORCH_HOME", str(root / "torch"))
+    if offline_mode is not None:
+        os.environ[_OFFLINE_ENV] = "1" if offline_mode else ""
+    if offline():
+        _block_downloads()
+    return root
+
+
+def _block_downloads() -> None:
+    """Make torch.hub raise instead of downloading (it only downloads when
+    a checkpoint is missing from TORCH_HOME)."""
+    try:
+        import torch.hub
+    except Exception:
+        return
+
+    def _refuse(url, dst, *a, **kw):
+        raise FileNotFoundError(
+            f"{Path(dst).name} is not in the model store and UCR_OFFLINE is set; "
+            f"run `python -m models.weights` on a connected host and copy {models_dir()}"
+        )
+    torch.hub.download_url_to_file = _refuse
+
+
+# ----------------------------------------------------------------------
+# Whisper – memory-mapped load straight from the store
+# ----------------------------------------------------------------------
+def whisper_checkpoint(name: str) -> Path:
+    import whisper
+    return models_dir() / "whisper" / os.path.basename(whisper._MODELS[name])
+
+
+def _whisper_sha(name: str) -> str:
+    import whisper
+    return whisper._MODELS[name].split("/")[-2]
+
+
+def fetch_whisper(name: str) -> Path:
+    """Return the checkpoint path for *name*, downloading it if allowed."""
+    import whisper
+    path = whisper_checkpoint(name)
+    if not path.exists():
+        if offline():
+            raise FileNotFoundError(
+                f"Whisper '{name}' is not in {path.parent} and UCR_OFFLINE is set"
+            )
+        whisper._download(whisper._MODELS[name], str(path.parent), False)
+    return path
+
+
+def load_whisper(name: str, device: Optional[str] = None):
+    """Load Whisper *name* from the store, mmap-ing the checkpoint.
+
+    Unlike ``whisper.load_model`` this doesn't read and re-hash the whole
+    file on every load (``verify`` does that once); on torch >= 2.1 the
+    tensors are paged in from the mapped file while being copied into the
+    model. The checkpoints are stored in fp16 and, as with
+    ``whisper.load_model``, the copy casts them to the model's fp32.
+    """
+    import torch
+    import whisper
+    from whisper.model import ModelDimensions, Whisper
+
+    if name not in whisper._MODELS:            # local checkpoint path etc.
+        return whisper.load_model(name, device=device)
+    if device is None:
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+
+    path = fetch_whisper(name)
+    try:
+        ckpt = torch.load(str(path), map_location="cpu", mmap=True, weights_only=True)
+    except (TypeError, RuntimeError):          # torch < 2.1 / legacy format
+        ckpt = torch.load(str(path), map_location="cpu")
+
+    model = Whisper(ModelDimensions(**ckpt["dims"]))
+    model.load_state_dict(ckpt["model_state_dict"])
+    model.set_alignment_heads(whisper._ALIGNMENT_HEADS[name])
+    return model.to(device)
+
+
+# ----------------------------------------------------------------------
+# Preload / verify
+# ----------------------------------------------------------------------
+def preload(whisper_names: List[str], demucs_names: List[str]) -> None:
+    for name in whisper_names:
+        print(f"[Weights] whisper {name} → {fetch_whisper(name)}")
+    from demucs.pretrained import get_model
+    for name in demucs_names:
+        get_model(name)
+        print(f"[Weights] demucs {name} → {models_dir() / 'torch'}")
+
+
+def verify(whisper_names: List[str], demucs_names: List[str]) -> bool:
+    """Check every requested model is present (and Whisper files intact)
+    without touching the network."""
+    os.environ[_OFFLINE_ENV] = "1"
+    _block_downloads()
+    ok = True
+    for name in whisper_names:
+        path = whisper_checkpoint(name)
+        h = hashlib.sha256()
+        try:
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    h.update(block)
+            good = h.hexdigest() == _whisper_sha(name)
+        except OSError:
+            good = False
+        print(f"[Weights] whisper {name:12s} {'ok' if good else 'MISSING/CORRUPT'}  {path}")
+        ok &= good
+    for name in demucs_names:
+        try:
+            from demucs.pretrained import get_model
+            get_model(name)
+            good = True
+        except Exception as exc:
+            print(f"          {exc}")
+            good = False
+        print(f"[Weights] demucs  {name:12s} {'ok' if good else 'MISSING'}")
+        ok &= good
+    return ok
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="Pre-fetch or verify model weights")
+    p.add_argument("--models-dir", help=f"store location (env {_DIR_ENV})")
+    p.add_argument("--whisper", nargs="*", default=DEFAULT_WHISPER, metavar="NAME")
+    p.add_argument("--demucs", nargs="*", default=DEFAULT_DEMUCS, metavar="NAME")
+    p.add_argument("--verify", action="store_true", help="check offline; don't download")
+    args = p.parse_args(argv)
+
+    print("[Weights] store:", configure(args.models_dir))
+    if args.verify:
+        return 0 if verify(args.whisper, args.demucs) else 1
+    preload(args.whisper, args.demucs)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,4 +1,5 @@
 from __future__ import annotations
+import os
 from typing import Tuple, List
 import librosa
 import numpy as np
@@ -10,8 +11,8 @@ try:
 except ImportError:
     from essentia.standard import KeyExtractor
     def key_estimate(y, sr):
-        ke = KeyExtractor()
-        key, scale, _strength = ke(y, sr)
+        ke = KeyExtractor(sampleRate=sr)
+        key, scale, _strength = ke(y)
         return f"{key}{'' if scale=='major' else 'm'}"
 
 NOTE_NAMES = ["C","C#","D","D#","E","F","F#","G","G#","A","A#","B"]
@@ -31,34 +32,140 @@ def _build_templates():
     tmpls = {}
     for i, name in enumerate(NOTE_NAMES):
         for suf, steps in CHORD_INTERVALS.items():
-            vec = np.zeros(12)
+            vec = np.zeros(12, dtype=np.float32)
             vec[(i + np.array(steps)) % 12] = 1
             tmpls[name + suf] = vec
     return tmpls
 _TEMPLATES = _build_templates()
 
+# ----------------------------------------------------------------------
+# Chroma front-ends
+#   cqt     – chroma_cqt on the full-rate signal (historical default)
+#   cqt22k  – chroma_cqt on a 22.05 kHz copy, hop 512 (~23 ms frames)
+#   stft    – chroma_stft on the 22.05 kHz copy, n_fft 4096 / hop 512
+# With beat_sync the frames are median-pooled between the given beats.
+# ----------------------------------------------------------------------
+CHROMA_FRONTENDS = ("cqt", "cqt22k", "stft")
+_CHROMA_ENV      = "UCR_CHROMA"
+_BEAT_SYNC_ENV   = "UCR_CHROMA_BEAT_SYNC"
+_FAST_SR, _FAST_HOP = 22050, 512
+
+_NAMES = list(_TEMPLATES)
+_MATRIX = np.stack([_TEMPLATES[n] for n in _NAMES])
+_MATRIX_NORM = np.linalg.norm(_MATRIX, axis=1)
+
+
+def _chroma(y, sr, frontend: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Return (chroma (12, n), frame start times) for *frontend*."""
+    if frontend == "cqt":
+        chroma = librosa.feature.chroma_cqt(y=y, sr=sr)
+        hop, rate = 512, sr
+    elif frontend in ("cqt22k", "stft"):
+        if sr != _FAST_SR:
+            y = librosa.resample(y, orig_sr=sr, target_sr=_FAST_SR)
+        hop, rate = _FAST_HOP, _FAST_SR
+        if frontend == "cqt22k":
+            chroma = librosa.feature.chroma_cqt(y=y, sr=rate, hop_length=hop)
+        else:
+            chroma = librosa.feature.chroma_stft(y=y, sr=rate, n_fft=4096, hop_length=hop)
+    else:
+        raise ValueError(f"unknown chroma front-end {frontend!r}; use one of {CHROMA_FRONTENDS}")
+    times = librosa.frames_to_time(np.arange(chroma.shape[1]), sr=rate, hop_length=hop)
+    return chroma, times
+
+
+def _beat_sync(chroma, times, beats: List[float]) -> Tuple[np.ndarray, np.ndarray]:
+    """Median-pool *chroma* between *beats*; one column per inter-beat span."""
+    hop = times[1] - times[0] if len(times) > 1 else 1.0
+    frames = np.round(np.asarray(beats) / hop).astype(int)
+    frames = librosa.util.fix_frames(frames, x_min=0, x_max=chroma.shape[1])
+    pooled = librosa.util.sync(chroma, frames, aggregate=np.median)
+    return pooled, frames[:-1] * hop
+
+
+def _match(chroma) -> Tuple[List[str], np.ndarray]:
+    """Best template name and cosine score for every chroma column."""
+    chroma = chroma.astype(np.float32, copy=False)
+    scores = (_MATRIX @ chroma) / (
+        _MATRIX_NORM[:, None] * np.linalg.norm(chroma, axis=0)[None, :] + 1e-6
+    )
+    best = np.argmax(scores, axis=0)
+    return [_NAMES[i] for i in best], scores[best, np.arange(scores.shape[1])]
+
+
 def analyze_instrumental(
-        wav_path: str, *, bpm: float|None=None, beats: List[float]|None=None
+        wav_path: str, *, bpm: float|None=None, beats: List[float]|None=None,
+        chroma: str|None=None, beat_sync: bool|None=None,
 ) -> Tuple[str, List[Tuple[str, float, float]]]:
-    y, sr = sf.read(wav_path, always_2d=False)
+    """Return (key, [(chord, time, score), ...]) for an instrumental stem.
+
+    *chroma* picks the front-end (``UCR_CHROMA``, default ``"cqt"``);
+    *beat_sync* (``UCR_CHROMA_BEAT_SYNC``) pools frames between *beats*.
+    """
+    frontend = chroma or os.environ.get(_CHROMA_ENV) or "cqt"
+    if beat_sync is None:
+        beat_sync = os.environ.get(_BEAT_SYNC_ENV, "").strip().lower() in {"1", "true", "yes", "on"}
+
+    y, sr = sf.read(wav_path, always_2d=False, dtype="float32")
     if y.ndim > 1:
-        y = y.mean(axis=1)
+        y = y.mean(axis=1, dtype=np.float32)
 
     # --- key ---
     est_key = key_estimate(y, sr)
 
-    # --- chords via simple template match on CQT ---
-    chroma = librosa.feature.chroma_cqt(y=y, sr=sr)
-    chords: List[Tuple[str, float, float]] = []
-    for i in range(chroma.shape[1]):
-        frame = chroma[:, i]
-        best, best_score = None, -1.0
-        for name, tmpl in _TEMPLATES.items():
-            score = float(np.dot(frame, tmpl) / (np.linalg.norm(frame) * np.linalg.norm(tmpl) + 1e-6))
-            if score > best_score:
-                best, best_score = name, score
-        if best:
-            time_s = float(librosa.frames_to_time(i, sr=sr))
-            chords.append((best, time_s, best_score))
+    # --- chords via template match on the chosen chroma ---
+    feats, times = _chroma(y, sr, frontend)
+    if beat_sync and beats is not None and len(beats) > 1:
+        feats, times = _beat_sync(feats, times, beats)
+    names, scores = _match(feats)
+    chords: List[Tuple[str, float, float]] = [
+        (name, float(t), float(sc)) for name, t, sc in zip(names, times, scores)
+    ]
 
     return est_key, chords
+
+
+def _agreement(ref, other) -> float:
+    """Share of *ref* frames whose chord equals *other*'s chord at that time."""
+    if not ref or not other:
+        return 0.0
+    o_times = np.array([t for _n, t, _s in other])
+    idx = np.clip(np.searchsorted(o_times, [t for _n, t, _s in ref], side="right") - 1,
+                  0, len(other) - 1)
+    return float(np.mean([r[0] == other[i][0] for r, i in zip(ref, idx)]))
+
+
+def compare_frontends(wav_path: str, beats: List[float]|None=None) -> dict:
+    """Time every front-end on *wav_path* and score chord agreement with the
+    historical CQT output. Returns {label: (seconds, agreement, peak bytes)};
+    the peak is NumPy/Python allocation traced by tracemalloc."""
+    import time
+    import tracemalloc
+    results, ref = {}, None
+    variants = [(f, False) for f in CHROMA_FRONTENDS]
+    if beats:
+        variants += [(f, True) for f in CHROMA_FRONTENDS]
+    for frontend, sync in variants:
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        _key, chords = analyze_instrumental(wav_path, beats=beats, chroma=frontend, beat_sync=sync)
+        elapsed = time.perf_counter() - t0
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        ref = ref if ref is not None else chords
+        results[frontend + ("+beats" if sync else "")] = (elapsed, _agreement(ref, chords), peak)
+    return results
+
+
+if __name__ == "__main__":
+    import sys
+    for path in sys.argv[1:]:
+        try:
+            from bpm_drums import bpm_via_librosa
+            _bpm, beat_times = bpm_via_librosa(path)
+        except Exception:
+            beat_times = None
+        print(path)
+        for label, (secs, agree, peak) in compare_frontends(path, beat_times).items():
+            print(f"  {label:13s} {secs:7.2f}s  agreement {agree * 100:5.1f}%"
+                  f"  peak {peak / 2 ** 20:7.1f} MiB")
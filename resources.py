@@ -0,0 +1,185 @@
+"""Process-wide thread and memory limits for Ultimate Chord Reader.
+
+torch, NumPy/BLAS (via librosa), ffmpeg and the Demucs CLI all pick their
+own thread counts, and on a big host they oversubscribe each other.
+:func:`configure` resolves one budget (``--threads`` / ``UCR_THREADS``,
+``--max-memory`` / ``UCR_MAX_MEMORY``) and applies it everywhere:
+
+* exports the OpenMP/BLAS thread variables, so spawned workers and
+  subprocesses inherit them,
+* caps BLAS pools that are already loaded (threadpoolctl, if installed),
+* sets torch's intra-op thread count.
+
+Pools size themselves with :func:`pool_size` / :func:`worker_threads` /
+:func:`worker_memory`, and
+:func:`plan_track` checks a track's estimated memory against the budget
+before it starts, falling back to serial or streaming separation.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import sys
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+_THREADS_ENV = "UCR_THREADS"
+_MEMORY_ENV  = "UCR_MAX_MEMORY"
+_THREAD_VARS = (
+    "OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS",
+    "NUMEXPR_NUM_THREADS", "VECLIB_MAXIMUM_THREADS",
+)
+
+# Rough memory model (bytes). Full-track separation holds the decoded
+# input, its normalised copy, every source, the no_vocals mix and Demucs'
+# overlap-add buffer, all float32 stereo; streaming holds that per
+# segment. With --demucs-jobs every worker loads its own model and holds a
+# window, while the parent also keeps the full-length crossfade buffers.
+# After separation, BPM and chord analysis load the whole stem as mono
+# float32 (plus resampled / filtered copies) whatever the separation mode;
+# streaming skips the drum-stem Demucs pass and UVR, which would not.
+MODEL_OVERHEAD   = 2 * 1024 ** 3          # torch + Demucs + Whisper weights
+WORKER_OVERHEAD  = 1024 ** 3              # one spawned Demucs worker
+SAMPLE_RATE      = 44100
+CHANNELS         = 2
+STEMS            = 6
+STREAM_SECONDS   = 30.0                   # mirrors models.demucs_loader
+SEGMENT_SECONDS  = 60.0                   # mirrors models.demucs_loader
+ANALYSIS_BUFFERS = 4                      # mono copies held by BPM / chords
+
+
+@dataclass
+class Limits:
+    threads: int
+    max_memory: Optional[int]   # bytes; None = unlimited
+
+
+_LIMITS: Optional[Limits] = None
+
+
+def parse_memory(text: str) -> int:
+    """``"8G"`` / ``"512m"`` / ``"1.5GiB"`` / ``"1048576"`` → bytes."""
+    m = re.fullmatch(r"\s*([\d.]+)\s*([kmgt]?)(i?b)?\s*", str(text), re.IGNORECASE)
+    if not m:
+        raise ValueError(f"invalid memory size: {text!r}")
+    scale = {"": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3, "t": 1024 ** 4}
+    return int(float(m.group(1)) * scale[m.group(2).lower()])
+
+
+def configure(threads: Optional[int] = None, max_memory: Optional[str] = None) -> Limits:
+    """Resolve and apply the process-wide limits (arguments → env → defaults)."""
+    global _LIMITS
+    threads = threads or int(os.environ.get(_THREADS_ENV) or 0) or (os.cpu_count() or 1)
+    mem_text = max_memory or os.environ.get(_MEMORY_ENV)
+    _LIMITS = Limits(threads=max(1, threads),
+                     max_memory=parse_memory(mem_text) if mem_text else None)
+
+    os.environ[_THREADS_ENV] = str(_LIMITS.threads)
+    if mem_text:
+        os.environ[_MEMORY_ENV] = str(mem_text)
+    for var in _THREAD_VARS:
+        os.environ[var] = str(_LIMITS.threads)
+
+    try:  # BLAS/OpenMP pools loaded before we got here (numpy via librosa)
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(_LIMITS.threads)
+    except Exception:
+        pass
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(_LIMITS.threads)
+    return _LIMITS
+
+
+def limits() -> Limits:
+    return _LIMITS or configure()
+
+
+def pool_size(requested: int, threads_per_worker: int = 1) -> int:
+    """Clamp a requested worker count to the thread budget."""
+    return max(1, min(requested, limits().threads // max(1, threads_per_worker)))
+
+
+def worker_threads(workers: int) -> int:
+    """Threads each of *workers* pool processes may use."""
+    return max(1, limits().threads // max(1, workers))
+
+
+def worker_memory(workers: int) -> Optional[int]:
+    """Memory budget of each of *workers* track processes (None = unlimited)."""
+    budget = limits().max_memory
+    return None if budget is None else budget // max(1, workers)
+
+
+def subprocess_env(threads: Optional[int] = None) -> Dict[str, str]:
+    """Environment for child processes (Demucs CLI, UVR) with thread caps."""
+    env = dict(os.environ)
+    for var in _THREAD_VARS:
+        env[var] = str(threads or limits().threads)
+    return env
+
+
+def ffmpeg_threads() -> List[str]:
+    """``-threads N`` for ffmpeg command lines."""
+    return ["-threads", str(limits().threads)]
+
+
+def _bytes_per_second(buffers: int) -> int:
+    return buffers * CHANNELS * SAMPLE_RATE * 4
+
+
+def estimate_memory(seconds: float, *, stream: bool = False, jobs: int = 1) -> int:
+    """Peak bytes for analysing *seconds* of audio: the larger of the
+    separation (streaming, or with *jobs* segmented workers, which only
+    kick in past two windows) and the full-length analysis passes."""
+    full = 2 + 2 * STEMS + 1                  # input, copy, sources ×2, mix
+    analysis = ANALYSIS_BUFFERS * SAMPLE_RATE * 4 * max(seconds, 0.0)
+    if stream:
+        return int(MODEL_OVERHEAD + max(_bytes_per_second(full) * STREAM_SECONDS, analysis))
+    separation = _bytes_per_second(full) * seconds
+    if jobs > 1 and seconds > 2 * SEGMENT_SECONDS:
+        # parent: numpy copy of the input + crossfade buffer (sources, weight)
+        separation += _bytes_per_second(1 + STEMS) * seconds + SAMPLE_RATE * 4 * seconds
+        # each worker: its model plus one window in and its sources out
+        separation += jobs * (WORKER_OVERHEAD + _bytes_per_second(1 + STEMS) * SEGMENT_SECONDS)
+    return int(MODEL_OVERHEAD + max(separation, analysis))
+
+
+def plan_track(seconds: float, *, jobs: Optional[int] = None,
+               stream: Optional[bool] = None, budget: Optional[int] = None) -> dict:
+    """Separation options that keep a *seconds*-long track inside the memory
+    budget: ``{}`` when the requested path fits, ``{"jobs": 1}`` when only
+    serial separation does, ``{"stream": True}`` when only streaming does.
+    Raises MemoryError when nothing fits. An unknown duration (<= 0) is
+    assumed not to fit the full-track paths.
+
+    *jobs* and *stream* are the requested Demucs options, defaulting to
+    ``UCR_DEMUCS_JOBS`` / ``UCR_DEMUCS_STREAM`` like ``run_demucs``;
+    *budget* defaults to this process's ``max_memory``.
+    """
+    budget = limits().max_memory if budget is None else budget
+    if budget is None:
+        return {}
+    jobs = int(os.environ.get("UCR_DEMUCS_JOBS", "1")) if jobs is None else jobs
+    if stream is None:
+        stream = os.environ.get("UCR_DEMUCS_STREAM", "").strip().lower() in {"1", "true", "yes", "on"}
+    gib = 1024 ** 3
+    if seconds > 0 and not stream:
+        if estimate_memory(seconds, jobs=jobs) <= budget:
+            return {}
+        if jobs > 1 and estimate_memory(seconds) <= budget:
+            print(f"[Resources] {seconds / 60:.1f} min × {jobs} Demucs workers needs "
+                  f"~{estimate_memory(seconds, jobs=jobs) / gib:.1f} GiB > budget; "
+                  f"separating serially")
+            return {"jobs": 1}
+        reason = f"{seconds / 60:.1f} min needs ~{estimate_memory(seconds) / gib:.1f} GiB > budget"
+    else:
+        reason = "streaming requested" if stream else "duration unknown"
+    if estimate_memory(seconds, stream=True) <= budget:
+        if not stream:
+            print(f"[Resources] {reason}; streaming in {STREAM_SECONDS:.0f}s segments")
+        return {"stream": True}
+    raise MemoryError(
+        f"track needs ~{estimate_memory(seconds, stream=True) / gib:.1f} GiB "
+        f"even when streaming; budget is {budget / gib:.1f} GiB"
+    )
@@ -0,0 +1,156 @@
+"""Duration-aware batch scheduling for Ultimate Chord Reader.
+
+A per-stage real-time-factor model predicts each track's cost from its
+duration. Tracks are started longest-first so one long file queued last
+can't set the makespan, and a running ETA is printed as tracks finish.
+After every track, its measured stage timings update the model, which is
+kept between runs (timings only, never audio).
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple, TypeVar
+
+T = TypeVar("T")
+
+_COST_ENV = "UCR_COST_MODEL"
+COST_FILE = Path(os.environ.get("XDG_STATE_HOME", Path.home() / ".local" / "state")) \
+    / "ultimate_chord_reader" / "cost_model.json"
+
+# seconds of work per second of audio, per stage – overwritten by calibration
+DEFAULT_RTF: Dict[str, float] = {
+    "plan": 0.0,
+    "separation": 1.0,
+    "lyrics": 0.4,
+    "bpm": 1.0,         # drum-stem BPM runs its own Demucs pass
+    "chords": 0.15,
+    "chart": 0.0,
+}
+SMOOTHING = 0.3         # weight of the newest track in the running average
+LONG_TRACK = 15 * 60.0  # seconds; flagged as a candidate for the long-track modes
+
+
+class CostModel:
+    """Per-stage real-time factors, calibrated from previous runs."""
+
+    def __init__(self, rtf: Optional[Dict[str, float]] = None, path: Optional[Path] = None):
+        self.rtf = dict(DEFAULT_RTF)
+        self.rtf.update(rtf or {})
+        self.path = path
+
+    @classmethod
+    def load(cls, path: Optional[Path] = None) -> "CostModel":
+        path = Path(path or os.environ.get(_COST_ENV) or COST_FILE)
+        try:
+            rtf = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            rtf = {}
+        return cls({k: float(v) for k, v in rtf.items()}, path)
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(self.rtf, indent=2, sort_keys=True), encoding="utf-8")
+            os.replace(tmp, self.path)
+        except OSError as exc:
+            print(f"[Scheduler] could not save cost model ({exc})")
+
+    def predict(self, seconds: float) -> float:
+        """Predicted wall time for a track of *seconds*."""
+        return sum(self.rtf.values()) * seconds
+
+    def update(self, stages: Dict[str, float], seconds: float) -> None:
+        """Fold one track's measured stage times into the model."""
+        if seconds <= 0:
+            return
+        for stage, elapsed in stages.items():
+            observed = elapsed / seconds
+            old = self.rtf.get(stage)
+            self.rtf[stage] = observed if old is None else (1 - SMOOTHING) * old + SMOOTHING * observed
+
+
+def lpt_order(items: Sequence[T], cost: Dict[T, float]) -> List[T]:
+    """Longest-processing-time-first order (stable for equal costs)."""
+    return sorted(items, key=lambda it: -cost[it])
+
+
+class Eta:
+    """Running ETA: outstanding predicted work divided across *workers*,
+    scaled by how far actual times have drifted from the predictions."""
+
+    def __init__(self, predicted: Dict[object, float], workers: int = 1):
+        self.pending = dict(predicted)
+        self.workers = max(1, workers)
+        self.done_predicted = 0.0
+        self.done_actual = 0.0
+        self.started = time.perf_counter()
+
+    def finish(self, item: object, actual: float) -> None:
+        self.done_predicted += self.pending.pop(item, 0.0)
+        self.done_actual += actual
+
+    def remaining(self) -> float:
+        drift = self.done_actual / self.done_predicted if self.done_predicted > 0 else 1.0
+        return sum(self.pending.values()) * drift / self.workers
+
+    def line(self, done: int, total: int) -> str:
+        elapsed = time.perf_counter() - self.started
+        return (f"[ETA] {done}/{total} done · elapsed {_fmt(elapsed)}"
+                f" · ~{_fmt(self.remaining())} remaining")
+
+
+def _fmt(seconds: float) -> str:
+    m, s = divmod(int(round(seconds)), 60)
+    h, m = divmod(m, 60)
+    return f"{h}h{m:02d}m" if h else f"{m}m{s:02d}s"
+
+
+def preflight(paths: Sequence[Path], model: CostModel, *,
+              budget: Optional[int] = None) -> Tuple[Dict[Path, dict], Dict[Path, float]]:
+    """Probe every path; return ({path: probe info + "plan"}, {path: predicted seconds}).
+
+    "plan" is the resource governor's verdict against *budget* (default:
+    the process budget; pass the per-worker share when tracks run in
+    parallel): {} (normal), a serial or streaming fallback, or
+    {"refused": reason} when the track can't fit.
+    """
+    from audio_probe import probe
+    from resources import plan_track
+
+    info: Dict[Path, dict] = {}
+    cost: Dict[Path, float] = {}
+    for p in paths:
+        meta = probe(str(p))
+        try:
+            meta["plan"] = plan_track(meta["duration"], budget=budget)
+        except MemoryError as exc:
+            meta["plan"] = {"refused": str(exc)}
+        info[p] = meta
+        cost[p] = model.predict(meta["duration"])
+    return info, cost
+
+
+def describe(path: Path, meta: dict, predicted: float) -> str:
+    """One plan-table line, with any mode flags."""
+    flags = []
+    plan = meta.get("plan", {})
+    if "refused" in plan:
+        flags.append("REFUSED: " + plan["refused"])
+    elif plan.get("stream"):
+        flags.append("streaming")
+    elif plan.get("jobs") == 1:
+        flags.append("serial Demucs")
+    if meta["duration"] >= LONG_TRACK:
+        flags.append("long track")
+    if meta["duration"] <= 0:
+        flags.append("duration unknown")
+    fmt = f"{meta['codec'] or '?'}/{meta['sample_rate'] or '?'}Hz/{meta['channels'] or '?'}ch"
+    return (f"  {path.name:40s} {_fmt(meta['duration']):>7s}  {fmt:22s}"
+            f" est {_fmt(predicted):>7s}" + (f"  ⚑ {', '.join(flags)}" if flags else ""))
@@ -0,0 +1,257 @@
+"""Importable analysis API for Ultimate Chord Reader.
+
+    from session import AnalysisSession
+
+    with AnalysisSession(whisper_model="small", language="en") as s:
+        result = s.analyze("song.wav")             # or s.analyze(y, sr=44100)
+        print(result.bpm, result.key, result.chords[:4])
+        chart = result.to_chart()                  # optional text renderer
+
+An AnalysisSession keeps its configuration and warm models (Whisper, Demucs)
+across calls, and returns an :class:`AnalysisResult` instead of writing a
+chart file. Stems still pass through a private temp dir, as the separation
+backends work on files, and they are zero-filled and removed before
+``analyze`` returns. Options left as None fall back to the usual
+``UCR_*`` environment variables.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+import math
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple, Union
+
+import metrics
+from ultimate_chord_reader import (
+    TIME_SIGNATURE, format_chart, overwrite_and_remove, run_separation, safe_analyze,
+)
+
+if TYPE_CHECKING:
+    import numpy as np
+
+
+@dataclass
+class ChordSegment:
+    name: str
+    start: float
+    end: float
+    confidence: float        # mean template score over the segment, 0–1
+
+
+@dataclass
+class LyricLine:
+    start: float
+    end: float
+    text: str
+    confidence: float        # exp(avg_logprob), 0–1
+    avg_logprob: float
+
+
+@dataclass
+class AnalysisResult:
+    title: str
+    duration: float
+    bpm: float
+    bpm_source: str          # "drums" | "no-vocals" | "mix"
+    beat_times: List[float]
+    key: str
+    chords: List[ChordSegment]
+    lyrics: List[LyricLine]
+    lyric_confidence: float  # percent, as printed in the chart header
+    separation_score: float
+    timings: Dict[str, float] = field(default_factory=dict)
+    # raw per-frame (name, time, score) matches, as format_chart expects
+    chord_frames: List[Tuple[str, float, float]] = field(default_factory=list, repr=False)
+
+    def to_chart(self, title: Optional[str] = None, time_sig: str = TIME_SIGNATURE) -> str:
+        """Render the classic one-bar-per-line text chart."""
+        lyrics = [(l.start, l.end, l.text, l.avg_logprob) for l in self.lyrics]
+        return format_chart(title or self.title, self.bpm, self.key, time_sig,
+                            lyrics, self.chord_frames, self.lyric_confidence,
+                            self.beat_times)
+
+
+def _segments(frames: List[Tuple[str, float, float]], end: float) -> List[ChordSegment]:
+    """Collapse per-frame chord matches into runs of the same chord."""
+    out: List[ChordSegment] = []
+    scores: List[float] = []
+    for name, t, score in frames:
+        if out and out[-1].name == name:
+            scores.append(score)
+            continue
+        if out:
+            out[-1].end = t
+            out[-1].confidence = sum(scores) / len(scores)
+        out.append(ChordSegment(name, t, t, score))
+        scores = [score]
+    if out:
+        out[-1].end = max(end, out[-1].start)
+        out[-1].confidence = sum(scores) / len(scores)
+    return out
+
+
+def _env_flag(name: str) -> bool:
+    import os
+    return os.environ.get(name, "").strip().lower() in {"1", "true", "yes", "on"}
+
+
+def _bpm(inst: str, mix: str, *, drums: bool = True) -> Tuple[float, List[float], str]:
+    """(bpm, beat times, source): the drum stem (a second, full-track Demucs
+    pass, skipped with *drums* False), then the no-vocals stem, then the mix."""
+    from bpm_drums import get_bpm_from_drums, bpm_via_librosa
+    if drums:
+        try:
+            return (*get_bpm_from_drums(inst), "drums")
+        except Exception:
+            pass
+    try:
+        return (*bpm_via_librosa(inst), "no-vocals")
+    except Exception:
+        return (*bpm_via_librosa(mix), "mix")
+
+
+class AnalysisSession:
+    """Configured, warm analysis pipeline. See the module docstring."""
+
+    def __init__(
+        self, *,
+        whisper_model: Optional[str] = None, whisper_int8: Optional[bool] = None,
+        language: Optional[str] = None, greedy: Optional[bool] = None,
+        whisper_workers: Optional[int] = None,
+        demucs_jobs: Optional[int] = None, stream: Optional[bool] = None,
+        probe: Optional[bool] = None,
+        chroma: Optional[str] = None, beat_sync: Optional[bool] = None,
+        max_workers: int = 1,
+    ):
+        self.lyric_opts = dict(model_size=whisper_model, quantize=whisper_int8,
+                               language=language, greedy=greedy, workers=whisper_workers)
+        self.separation_opts = dict(jobs=demucs_jobs, stream=stream, probe=probe)
+        self.chord_opts = dict(chroma=chroma, beat_sync=beat_sync)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    # ------------------------------------------------------------------
+    def warm(self) -> "AnalysisSession":
+        """Load the Whisper and Demucs models now instead of on first use."""
+        import lyrics
+        from models import demucs_loader
+
+        lyrics.load_model(self.lyric_opts["model_size"], self.lyric_opts["quantize"])
+        if demucs_loader.get_model is not None:
+            demucs_loader.load_model("htdemucs_6s")
+        return self
+
+    def analyze(self, source: Union[str, Path, "np.ndarray"], *, sr: Optional[int] = None,
+                title: Optional[str] = None) -> AnalysisResult:
+        """Run the full pipeline on a file path or a (samples[, channels]) array."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            if isinstance(source, (str, Path)):
+                path = str(source)
+                title = title or Path(path).stem
+                return self._analyze_file(path, title, tmpdir)
+
+            if sr is None:
+                raise ValueError("sr is required when analysing an array")
+            import numpy as np
+            import soundfile as sf
+            wav = Path(tmpdir) / "input.wav"
+            sf.write(str(wav), np.asarray(source, dtype=np.float32), sr, subtype="FLOAT")
+            try:
+                return self._analyze_file(str(wav), title or "untitled", tmpdir)
+            finally:
+                overwrite_and_remove(wav)
+
+    async def analyze_async(self, source, *, sr: Optional[int] = None,
+                            title: Optional[str] = None) -> AnalysisResult:
+        """:meth:`analyze` on the session's executor, awaitable from asyncio."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(self.analyze, source, sr=sr, title=title)
+        )
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self) -> "AnalysisSession":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # ------------------------------------------------------------------
+    def _analyze_file(self, path: str, title: str, tmpdir: str) -> AnalysisResult:
+        from lyrics import transcribe
+        from audio_probe import duration
+        from resources import plan_track
+
+        timings: Dict[str, float] = {}
+
+        def timed(name: str):
+            """Wrap a call in metrics.stage(name), timing it into *timings*."""
+            def run(fn, *a, **kw):
+                with metrics.stage(name, timings):
+                    return fn(*a, **kw)
+            return run
+
+        t0 = time.perf_counter()
+        audio_s = duration(path)
+
+        # refuse or downgrade (streaming) before touching the audio
+        sep_opts = dict(self.separation_opts)
+        sep_opts.update(timed("plan")(plan_track, audio_s, jobs=sep_opts["jobs"],
+                                      stream=sep_opts["stream"]))
+
+        # 1. separation ------------------------------------------------------
+        vocal, inst, sep_score = timed("separation")(
+            run_separation, path, tmpdir, model="htdemucs_6s", **sep_opts
+        )
+        try:
+            # 2. lyrics ------------------------------------------------------
+            lyric_lines = timed("lyrics")(transcribe, str(vocal), tmpdir, **self.lyric_opts)
+
+            # 3. BPM & beat times -------------------------------------------
+            streaming = sep_opts["stream"]
+            if streaming is None:
+                streaming = _env_flag("UCR_DEMUCS_STREAM")
+            if streaming:
+                print("[BPM] streaming: skipping the full-track drum-stem pass")
+            bpm, beat_times, src = timed("bpm")(_bpm, str(inst), path, drums=not streaming)
+            metrics.inc("ucr_bpm_source_total", source=src)
+            print(f"[BPM] {src:9s} → {bpm:.1f}")
+
+            # 4. key + chords -----------------------------------------------
+            key, chord_seq = timed("chords")(
+                safe_analyze, str(inst), bpm=bpm, beats=beat_times, **self.chord_opts
+            )
+        finally:
+            overwrite_and_remove(vocal)
+            overwrite_and_remove(inst)
+
+        # 5. confidence ------------------------------------------------------
+        if lyric_lines:
+            avg_conf = sum(math.exp(c) for *_x, c in lyric_lines) / len(lyric_lines) * 100
+        else:
+            avg_conf = 0.0
+
+        if audio_s > 0:
+            metrics.observe("ucr_track_realtime_factor", (time.perf_counter() - t0) / audio_s)
+
+        return AnalysisResult(
+            title=title,
+            duration=audio_s,
+            bpm=float(bpm),
+            bpm_source=src,
+            beat_times=[float(b) for b in beat_times],
+            key=key,
+            chords=_segments(chord_seq, audio_s),
+            lyrics=[LyricLine(s, e, txt, math.exp(c), c) for s, e, txt, c in lyric_lines],
+            lyric_confidence=avg_conf,
+            separation_score=float(sep_score),
+            timings=timings,
+            chord_frames=list(chord_seq),
+        )
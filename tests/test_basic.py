@@ -2,8 +2,10 @@ import sys
 import importlib.util
 from pathlib import Path
 
+import pytest
+
 # Add stub modules to sys.path so imports in production code succeed
-sys.path.insert(0, str(Path(__file__).resolve().parent / 'stubs'))
+sys.path.append(str(Path(__file__).resolve().parent / 'stubs'))
 
 # Load ultimate_chord_reader as a module from its file
 ucr_path = Path(__file__).resolve().parents[1] / 'ultimate_chord_reader.py'
@@ -12,6 +14,14 @@ ucr = importlib.util.module_from_spec(spec)
 spec.loader.exec_module(ucr)
 
 
+def _numpy():
+    """The real numpy, or skip (tests/stubs only has a placeholder)."""
+    np = pytest.importorskip('numpy')
+    if not hasattr(np, 'zeros'):
+        pytest.skip('numpy not installed')
+    return np
+
+
 def test_format_chart_basic(tmp_path):
     lyrics = [
         (0.0, 1.0, 'hello', 0.9),
@@ -66,3 +76,617 @@ def test_overwrite_and_remove(tmp_path):
     f.write_text('data')
     ucr.overwrite_and_remove(f)
     assert not f.exists()
+
+
+def test_overwrite_and_remove_zero_fills_in_blocks(tmp_path, monkeypatch):
+    f = tmp_path / 'stem.wav'
+    f.write_bytes(b'\xff' * 2500)
+    monkeypatch.setattr(Path, 'unlink', lambda self, missing_ok=False: None)
+    ucr.overwrite_and_remove(f, block=1024)
+    assert f.read_bytes() == bytes(2500)
+
+
+def test_parse_memory():
+    import resources
+    assert resources.parse_memory('512m') == 512 * 1024 ** 2
+    assert resources.parse_memory('1.5GiB') == int(1.5 * 1024 ** 3)
+    assert resources.parse_memory('2048') == 2048
+
+
+def test_plan_track_downgrades_to_streaming(monkeypatch):
+    import resources
+    monkeypatch.setattr(resources, '_LIMITS', resources.Limits(threads=4, max_memory=6 * 1024 ** 3))
+    assert resources.plan_track(180, jobs=1, stream=False) == {}
+    assert resources.plan_track(3600, jobs=1, stream=False) == {'stream': True}
+    # unknown duration never passes as "fits"
+    assert resources.plan_track(0, jobs=1, stream=False) == {'stream': True}
+    monkeypatch.setattr(resources, '_LIMITS', resources.Limits(threads=4, max_memory=1024 ** 3))
+    with pytest.raises(MemoryError):
+        resources.plan_track(60, jobs=1, stream=False)
+    monkeypatch.setattr(resources, '_LIMITS', resources.Limits(threads=4, max_memory=None))
+    assert resources.plan_track(0, jobs=1, stream=False) == {}
+
+
+def test_plan_track_counts_demucs_workers(monkeypatch):
+    import resources
+    assert resources.estimate_memory(600, jobs=4) > resources.estimate_memory(600) \
+        + 4 * resources.WORKER_OVERHEAD
+    assert resources.estimate_memory(90, jobs=4) == resources.estimate_memory(90)
+    monkeypatch.setattr(resources, '_LIMITS', resources.Limits(threads=8, max_memory=8 * 1024 ** 3))
+    assert resources.plan_track(600, jobs=4, stream=False) == {'jobs': 1}
+    assert resources.plan_track(600, jobs=1, stream=False) == {}
+
+
+def test_streamed_estimate_counts_analysis_passes():
+    import resources
+    hour = resources.estimate_memory(3600, stream=True)
+    assert hour > resources.estimate_memory(60, stream=True)
+    assert hour >= resources.MODEL_OVERHEAD \
+        + resources.ANALYSIS_BUFFERS * resources.SAMPLE_RATE * 4 * 3600
+
+
+def test_streaming_never_falls_back_to_cli(tmp_path, monkeypatch):
+    from models import demucs_loader as dl
+    calls = []
+    monkeypatch.setattr(dl, 'apply_model', None)
+    monkeypatch.setattr(dl, '_run', lambda cmd, *a, **kw: calls.append(cmd))
+    with pytest.raises(RuntimeError):
+        dl.run_demucs('song.wav', str(tmp_path), stream=True)
+    assert calls == []
+
+
+def test_streamed_separation_is_demucs_only(tmp_path, monkeypatch):
+    _numpy()
+    pytest.importorskip('soundfile')
+    from models import separation_manager as sm
+    calls = []
+    _fake_backends(monkeypatch, sm, calls)
+    monkeypatch.setattr(sm, '_probe', lambda *a, **kw: pytest.fail('probe ran'))
+    vocal, inst, score = sm.separate_and_score('song.wav', str(tmp_path), probe=True, stream=True)
+    assert calls == ['demucs'] and inst.exists()
+
+
+def test_streamed_bpm_skips_drum_pass(monkeypatch):
+    import bpm_drums
+    import session
+    monkeypatch.setattr(bpm_drums, 'get_bpm_from_drums', lambda p: pytest.fail('drum pass ran'))
+    monkeypatch.setattr(bpm_drums, 'bpm_via_librosa', lambda p: (120.0, [0.5]))
+    assert session._bpm('inst.wav', 'mix.wav', drums=False) == (120.0, [0.5], 'no-vocals')
+
+
+def test_probe_reads_ffmpeg_banner(monkeypatch):
+    import audio_probe
+    banner = (
+        "Input #0, mp3, from 'song.mp3':\n"
+        "  Duration: 01:02:03.50, start: 0.025057, bitrate: 128 kb/s\n"
+        "  Stream #0:0: Audio: mp3 (mp3float), 44100 Hz, stereo, fltp, 128 kb/s\n"
+    )
+
+    class Done:
+        stderr = banner
+    monkeypatch.setattr(audio_probe, '_from_ffprobe', lambda path, info: False)
+    monkeypatch.setattr(audio_probe.subprocess, 'run', lambda *a, **kw: Done())
+    assert audio_probe.probe('song.mp3') == {
+        'duration': 3723.5, 'format': 'mp3', 'codec': 'mp3',
+        'sample_rate': 44100, 'channels': 2,
+    }
+
+
+def test_metrics_textfile(tmp_path):
+    import metrics
+    reg = metrics.Registry()
+    reg.inc('ucr_bpm_source_total', source='no-vocals')
+    reg.inc('ucr_bpm_source_total', source='no-vocals')
+    reg.observe('ucr_separation_similarity', 0.42)
+    out = tmp_path / 'ucr.prom'
+    reg.write(out)
+    text = out.read_text()
+    assert 'ucr_bpm_source_total{source="no-vocals"} 2' in text
+    assert 'ucr_separation_similarity_bucket{le="0.4"} 0' in text
+    assert 'ucr_separation_similarity_bucket{le="0.5"} 1' in text
+    assert 'ucr_separation_similarity_count 1' in text
+    assert list(tmp_path.iterdir()) == [out]
+
+
+def test_metrics_concurrent_writes(tmp_path):
+    import metrics
+    from concurrent.futures import ThreadPoolExecutor
+    reg = metrics.Registry()
+    out = tmp_path / 'ucr.prom'
+
+    def work(i):
+        for _ in range(20):
+            reg.inc('ucr_tracks_total', outcome=f'ok{i % 3}')
+            reg.write(out)
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(work, range(8)))
+    assert reg.values[('ucr_tracks_total', (('outcome', 'ok0'),))] == 60
+    assert list(tmp_path.iterdir()) == [out]       # no temp file left behind
+    assert out.stat().st_mode & 0o444 == 0o444
+
+
+def test_scheduler_longest_first_and_calibration(tmp_path):
+    import scheduler
+    model = scheduler.CostModel({'separation': 1.0, 'lyrics': 0.5, 'bpm': 0.0,
+                                 'chords': 0.0, 'plan': 0.0, 'chart': 0.0},
+                                path=tmp_path / 'cost.json')
+    cost = {name: model.predict(sec) for name, sec in
+            [('short', 60.0), ('epic', 2400.0), ('mid', 300.0)]}
+    assert scheduler.lpt_order(['short', 'epic', 'mid'], cost) == ['epic', 'mid', 'short']
+
+    model.update({'separation': 120.0}, 60.0)     # observed RTF 2.0
+    assert 1.0 < model.rtf['separation'] < 2.0
+    model.save()
+    assert scheduler.CostModel.load(tmp_path / 'cost.json').rtf == model.rtf
+
+    eta = scheduler.Eta({'a': 10.0, 'b': 30.0}, workers=1)
+    eta.finish('a', 20.0)                          # running 2x slower than predicted
+    assert eta.remaining() == 60.0
+
+
+def test_preflight_uses_durations_and_per_worker_budget(monkeypatch):
+    import audio_probe
+    import resources
+    import scheduler
+    seconds = {'short.wav': 60.0, 'set.flac': 600.0, 'mid.mp3': 240.0}
+    monkeypatch.setattr(audio_probe, 'probe', lambda p: {
+        'duration': seconds[Path(p).name], 'format': '', 'codec': '',
+        'sample_rate': 44100, 'channels': 2})
+    monkeypatch.setattr(resources, '_LIMITS', resources.Limits(threads=8, max_memory=16 * 1024 ** 3))
+    monkeypatch.setenv('UCR_DEMUCS_JOBS', '1')
+    monkeypatch.delenv('UCR_DEMUCS_STREAM', raising=False)
+
+    paths = [Path(n) for n in seconds]
+    model = scheduler.CostModel()
+    info, cost = scheduler.preflight(paths, model)
+    assert [p.name for p in scheduler.lpt_order(paths, cost)] == ['set.flac', 'mid.mp3', 'short.wav']
+    assert all(meta['plan'] == {} for meta in info.values())
+
+    budget = resources.worker_memory(4)                  # 4 GiB per parallel track
+    assert budget == 4 * 1024 ** 3
+    info, _cost = scheduler.preflight(paths, model, budget=budget)
+    assert info[Path('set.flac')]['plan'] == {'stream': True}
+    assert info[Path('short.wav')]['plan'] == {}
+
+
+def test_analysis_result_segments_and_chart():
+    import session
+    frames = [('C', 0.0, 0.8), ('C', 1.0, 0.6), ('G', 2.0, 0.9)]
+    segs = session._segments(frames, end=4.0)
+    assert [(s.name, s.start, s.end) for s in segs] == [('C', 0.0, 2.0), ('G', 2.0, 4.0)]
+    assert abs(segs[0].confidence - 0.7) < 1e-9
+
+    result = session.AnalysisResult(
+        title='Test', duration=4.0, bpm=60.0, bpm_source='drums',
+        beat_times=[0, 1, 2, 3, 4], key='C', chords=segs,
+        lyrics=[session.LyricLine(0.0, 1.0, 'hello', 0.9, -0.1)],
+        lyric_confidence=90.0, separation_score=0.0, chord_frames=frames,
+    )
+    assert result.to_chart().splitlines()[-1] == 'C G\thello'
+    assert 'Title: Alias' in result.to_chart('Alias')
+
+
+def _tiny_whisper():
+    from whisper.model import ModelDimensions, Whisper
+    return Whisper(ModelDimensions(
+        n_mels=80, n_audio_ctx=1500, n_audio_state=64, n_audio_head=2, n_audio_layer=1,
+        n_vocab=51865, n_text_ctx=448, n_text_state=64, n_text_head=2, n_text_layer=1,
+    ))
+
+
+def test_whisper_int8_quantizes_linear_layers(monkeypatch):
+    torch = pytest.importorskip('torch')
+    pytest.importorskip('whisper')
+    pytest.importorskip('spellchecker')
+    import lyrics
+    monkeypatch.setattr(lyrics, 'load_whisper', lambda size, device=None: _tiny_whisper())
+    monkeypatch.setattr(lyrics, '_MODELS', {})
+    model = lyrics._load_model('tiny', True)
+    quantized = [m for m in model.modules()
+                 if isinstance(m, torch.ao.nn.quantized.dynamic.Linear)]
+    assert quantized
+    assert not any(isinstance(m, torch.nn.Linear) for m in model.modules())
+
+
+def test_shared_whisper_model_decodes_one_stem_at_a_time(tmp_path, monkeypatch):
+    np = _numpy()
+    torch = pytest.importorskip('torch')
+    pytest.importorskip('whisper')
+    pytest.importorskip('spellchecker')
+    sf = pytest.importorskip('soundfile')
+    from concurrent.futures import ThreadPoolExecutor
+    import lyrics
+    torch.manual_seed(0)
+    tiny = _tiny_whisper()
+    monkeypatch.setattr(lyrics, 'load_whisper', lambda size, device=None: tiny)
+    monkeypatch.setattr(lyrics, '_MODELS', {})
+    monkeypatch.setattr(lyrics, '_spellcheck_line', lambda text: text)
+    rng = np.random.default_rng(0)
+    stems = []
+    for k in range(4):
+        stem = tmp_path / f'vocals{k}.wav'
+        sf.write(str(stem), rng.uniform(-0.3, 0.3, 16000 * 3).astype(np.float32), 16000)
+        (tmp_path / f'work{k}').mkdir()
+        stems.append((str(stem), str(tmp_path / f'work{k}')))
+
+    def run(args):
+        return lyrics.transcribe(*args, model_size='tiny', quantize=False, language='en',
+                                 greedy=True, workers=1)
+    serial = [run(a) for a in stems]
+    with ThreadPoolExecutor(4) as pool:
+        assert list(pool.map(run, stems)) == serial
+    assert list(lyrics._MODELS.values()) == [tiny]    # one warm model, shared
+
+
+def test_silence_cuts_at_quietest_frame(monkeypatch):
+    np = _numpy()
+    pytest.importorskip('whisper')
+    pytest.importorskip('spellchecker')
+    import lyrics
+    monkeypatch.setattr(lyrics, 'CHUNK_SECONDS', 10.0)
+    monkeypatch.setattr(lyrics, 'CHUNK_SEARCH', 2.0)
+    sr = 1000                                      # 100-sample frames
+    audio = np.random.default_rng(0).uniform(-0.5, 0.5, 25 * sr).astype(np.float32)
+    audio[11300:11400] = 0.0                       # the only silent frame in 8–12 s
+    assert lyrics._silence_cuts(audio, sr=sr) == [0, 11350, len(audio)]
+
+
+def test_merge_chunks_dedupes_padding():
+    pytest.importorskip('whisper')
+    pytest.importorskip('spellchecker')
+    import lyrics
+    # chunk 0 owns [0, 10), chunk 1 starts 1 s early (padding) and owns [10, ∞)
+    spans = [(0.0, 0.0, 10.0), (9.0, 10.0, float('inf'))]
+    results = [
+        [(1.0, 2.0, 'first', -0.1),
+         (9.2, 9.8, 'twice', -0.1),                # also decoded by chunk 1
+         (9.5, 10.0, 'straddle', -0.2)],           # cut short at the chunk end
+        [(0.2, 0.8, 'twice', -0.1),
+         (0.5, 1.9, 'straddle', -0.2),             # full line, 9.5–10.9 s
+         (3.0, 4.0, 'last', -0.1)],
+    ]
+    merged = lyrics._merge_chunks(spans, results)
+    assert [text for _s, _e, text, _c in merged] == ['first', 'twice', 'straddle', 'last']
+    assert merged[1][:2] == (9.2, 9.8)
+    assert merged[2][:2] == (9.5, 10.9)                 # the uncut copy wins
+    assert merged[3][:2] == (12.0, 13.0)
+
+
+def test_demucs_windows_cover_track():
+    from models import demucs_loader
+    for length in (1000, 2500, 2501, 2999):
+        spans = demucs_loader._windows(length, 1000, 100)
+        assert spans[0][0] == 0 and spans[-1][1] == length
+        for (a, b), (c, d) in zip(spans, spans[1:]):
+            assert b - a == 1000 and d - c == 1000
+            assert b - c >= 100                    # neighbours share the overlap
+    assert demucs_loader._windows(800, 1000, 100) == [(0, 800)]
+
+
+def test_demucs_overlap_add_is_unit_weight():
+    np = _numpy()
+    from models import demucs_loader
+    fade_in = demucs_loader._fade(10, 4, 0)
+    fade_out = demucs_loader._fade(10, 0, 4)
+    assert np.allclose(fade_out[-4:] + fade_in[:4], 1.0) and fade_in.min() > 0
+
+    x = np.random.default_rng(1).standard_normal((2, 2999)).astype(np.float32)
+    spans = demucs_loader._windows(x.shape[-1], 1000, 100)
+    out = demucs_loader._overlap_add(spans, (x[:, a:b] for a, b in spans), x.shape[-1], 100)
+    assert np.allclose(out, x, atol=1e-6)
+
+
+def test_demucs_segmented_matches_serial():
+    np = _numpy()
+    from models import demucs_loader
+
+    def stub_model(x):
+        """Two 'sources' with 2 ms of context, like a (very) small separator."""
+        k = np.ones(89, dtype=np.float32) / 89
+        smooth = np.stack([np.convolve(ch, k, mode='same') for ch in x])
+        return np.stack([smooth, x - smooth])
+
+    sr = 44100
+    t = np.arange(int(8.5 * sr)) / sr
+    x = np.stack([np.sin(2 * np.pi * 220 * t), np.sin(2 * np.pi * 330 * t)])
+    x = x.astype(np.float32) * 0.5
+    size, overlap = 2 * sr, sr // 2
+    spans = demucs_loader._windows(x.shape[-1], size, overlap)
+    segmented = demucs_loader._overlap_add(
+        spans, (stub_model(x[:, a:b]) for a, b in spans), x.shape[-1], overlap)
+    serial = stub_model(x)
+    assert segmented.shape == serial.shape
+    assert np.max(np.abs(segmented - serial)) < 1e-3
+
+
+def test_demucs_stream_separate_is_linear_passthrough(tmp_path, monkeypatch):
+    np = _numpy()
+    torch = pytest.importorskip('torch')
+    sf = pytest.importorskip('soundfile')
+    from models import demucs_loader
+
+    class FakeModel:
+        samplerate, audio_channels = 1000, 2
+        sources = ['drums', 'bass', 'vocals', 'other']
+    gains = np.array([0.1, 0.2, 0.3, 0.4], dtype=np.float32)
+
+    def fake_apply(model, mix, **kw):                  # stem i = gains[i] · mix
+        return torch.from_numpy(gains[None, :, None, None] * mix.numpy()[:, None])
+
+    def fake_decode(cmd):                              # ffmpeg: copy as float32 wav
+        data, sr = sf.read(cmd[cmd.index('-i') + 1], dtype='float32')
+        sf.write(cmd[-1], data, sr, subtype='FLOAT')
+
+    sr = FakeModel.samplerate
+    t = np.arange(int(10.5 * sr)) / sr                 # 3 s segments, last one partial
+    x = 0.5 * np.stack([np.sin(2 * np.pi * 7 * t), np.cos(2 * np.pi * 3 * t)], axis=1)
+    x = (x - x.mean()).astype(np.float32)             # so de-normalising adds no offset
+    src = tmp_path / 'in.wav'
+    sf.write(str(src), x, sr, subtype='FLOAT')
+
+    monkeypatch.setattr(demucs_loader, 'apply_model', fake_apply)
+    monkeypatch.setattr(demucs_loader, '_run_quiet', fake_decode)
+    demucs_loader._stream_separate(src, tmp_path, FakeModel(), segment=3.0, overlap=1.0)
+
+    for name, k in zip(FakeModel.sources + ['no_vocals'], list(gains) + [0.7]):
+        stem, rate = sf.read(str(tmp_path / f'{name}.wav'), dtype='float32')
+        assert rate == sr and stem.shape == x.shape
+        assert np.max(np.abs(stem - k * x)) < 1e-3, name     # PCM_16 sinks
+    assert not (tmp_path / '_input.wav').exists()
+
+
+def test_separation_choose_rule():
+    _numpy()
+    pytest.importorskip('soundfile')
+    from models import separation_manager as sm
+    assert sm._choose(0.6, True, True) == 'uvr'
+    assert sm._choose(0.4, True, True) == 'demucs'
+    assert sm._choose(0.9, True, False) == 'demucs'
+    assert sm._choose(0.0, False, True) == 'uvr'
+    with pytest.raises(RuntimeError):
+        sm._choose(0.0, False, False)
+
+
+def _fake_backends(monkeypatch, sm, calls, *, uvr_fails=False):
+    def fake_run(name, fail=False):
+        def run(src, out_dir, **kw):
+            calls.append(name)
+            if fail:
+                raise RuntimeError(f'{name} crashed')
+            d = Path(out_dir)
+            d.mkdir(parents=True, exist_ok=True)
+            for stem in ('vocals.wav', 'no_vocals.wav'):
+                (d / stem).write_bytes(b'RIFF')
+            return d / 'vocals.wav', d / 'no_vocals.wav'
+        return run
+    monkeypatch.setattr(sm, 'run_demucs', fake_run('demucs'))
+    monkeypatch.setattr(sm, 'run_uvr', fake_run('uvr', uvr_fails))
+    monkeypatch.setattr(sm, 'find_uvr', lambda: 'uvr')
+    monkeypatch.setattr(sm, '_similarity', lambda a, b: 0.8)
+
+
+def test_separation_probe_failure_falls_back(tmp_path, monkeypatch):
+    import subprocess
+    _numpy()
+    pytest.importorskip('soundfile')
+    from models import separation_manager as sm
+    calls = []
+    _fake_backends(monkeypatch, sm, calls)
+
+    def broken_probe(*a, **kw):
+        raise subprocess.CalledProcessError(1, ['ffmpeg'])
+    monkeypatch.setattr(sm, '_probe', broken_probe)
+    vocal, inst, score = sm.separate_and_score('song.wav', str(tmp_path), probe=True)
+    assert sorted(calls) == ['demucs', 'uvr']      # the normal two-backend run
+    assert inst.exists() and score == 0.8
+
+
+def test_separation_probe_winner_fails_on_full_track(tmp_path, monkeypatch):
+    _numpy()
+    pytest.importorskip('soundfile')
+    from models import separation_manager as sm
+    calls = []
+    _fake_backends(monkeypatch, sm, calls, uvr_fails=True)
+    monkeypatch.setattr(sm, '_probe', lambda *a, **kw: ('uvr', 0.7))
+    vocal, inst, score = sm.separate_and_score('song.wav', str(tmp_path), probe=True)
+    assert calls == ['uvr', 'demucs']
+    assert inst.exists() and score == 0.7
+
+
+def test_separation_similarity_only_when_compared(tmp_path, monkeypatch):
+    _numpy()
+    pytest.importorskip('soundfile')
+    import metrics
+    from models import separation_manager as sm
+    calls = []
+    _fake_backends(monkeypatch, sm, calls, uvr_fails=True)
+    monkeypatch.setattr(metrics, 'REGISTRY', metrics.Registry())
+    monkeypatch.setattr(metrics, 'inc', metrics.REGISTRY.inc)
+    monkeypatch.setattr(metrics, 'observe', metrics.REGISTRY.observe)
+    sm.separate_and_score('song.wav', str(tmp_path / 'a'), probe=False)
+    assert metrics.REGISTRY.histograms == {}          # Demucs alone: nothing to score
+    _fake_backends(monkeypatch, sm, calls)
+    sm.separate_and_score('song.wav', str(tmp_path / 'b'), probe=False)
+    assert metrics.REGISTRY.histograms[('ucr_separation_similarity', ())][-2:] == [0.8, 1]
+
+
+def _song(np, seed, *, key=0, seconds=200.0, sr=11025, dynamic=False):
+    """Synthetic track: random diatonic triads, 2 s each, in *key*."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(2 * sr) / sr
+    env = np.minimum(1.0, np.minimum(t / 0.02, (2.0 - t) / 0.05))
+    scale = [0, 2, 4, 5, 7, 9, 11]
+    bars = []
+    for i in range(int(seconds / 2)):
+        deg = int(rng.integers(7))
+        notes = [key + scale[(deg + k) % 7] + 12 * ((deg + k) // 7) for k in (0, 2, 4)]
+        x = sum(np.sin(2 * np.pi * 220 * 2 ** (n / 12) * t) for n in notes)
+        loud = 1.0 + 0.8 * np.sin(i / 6.0) if dynamic else 1.0   # verse/chorus swell
+        bars.append(x * env * loud)
+    return (0.15 * np.concatenate(bars)).astype(np.float32)
+
+
+def _print(np, y, tag):
+    import fingerprint
+    chroma, envelope, dynamics = fingerprint._profile(y)
+    return {'sha256': tag, 'duration': len(y) / fingerprint.FP_RATE,
+            'chroma': chroma, 'envelope': envelope, 'dynamics': dynamics}
+
+
+def test_fingerprint_near_duplicates_match():
+    np = _numpy()
+    import fingerprint
+    rng = np.random.default_rng(7)
+    for dynamic in (False, True):
+        a = _song(np, 1, dynamic=dynamic)
+        # "re-encode": 30 ms encoder delay, softer, low-passed, with noise
+        re = np.concatenate([np.zeros(330, np.float32), a])[:len(a)]
+        re = np.convolve(re, np.ones(3) / 3, mode='same') * 0.6
+        re = (re + rng.normal(0, 0.003, len(re))).astype(np.float32)
+        louder = np.clip(a * 1.8, -1, 1)
+        ref = _print(np, a, 'a')
+        assert fingerprint._same(ref, _print(np, re, 're'))
+        assert fingerprint._same(ref, _print(np, louder, 'gain'))
+
+
+def test_fingerprint_different_songs_do_not_match():
+    np = _numpy()
+    import fingerprint
+    for dynamic in (False, True):
+        a = _print(np, _song(np, 1, dynamic=dynamic), 'a')
+        same_key = _print(np, _song(np, 2, dynamic=dynamic), 'b')
+        other_key = _print(np, _song(np, 3, key=5, dynamic=dynamic), 'c')
+        assert fingerprint._similarity(a, same_key) < 0.5
+        assert not fingerprint._same(a, same_key)
+        assert not fingerprint._same(a, other_key)
+    # the same audio, but 3 s longer (an edit), is a different file
+    y = _song(np, 1)
+    longer = np.concatenate([y, y[: 3 * fingerprint.FP_RATE]])
+    assert not fingerprint._same(_print(np, y, 'a'), _print(np, longer, 'long'))
+
+
+def test_chord_match_equals_per_frame_loop():
+    np = _numpy()
+    ma = pytest.importorskip('music_analysis')          # librosa + key estimator
+    chroma = np.random.default_rng(3).random((12, 200)).astype(np.float32)
+    chroma[:, 7] = 0.0                                  # silent frame
+    chroma[:, 8] = ma._TEMPLATES['E7']                  # exact template hit
+    names, scores = ma._match(chroma)
+
+    for i in range(chroma.shape[1]):                    # the original loop
+        frame = chroma[:, i]
+        best, best_score = None, -1.0
+        for name, tmpl in ma._TEMPLATES.items():
+            score = float(np.dot(frame, tmpl)
+                          / (np.linalg.norm(frame) * np.linalg.norm(tmpl) + 1e-6))
+            if score > best_score:
+                best, best_score = name, score
+        assert names[i] == best
+        assert abs(float(scores[i]) - best_score) < 1e-5
+    assert names[8] == 'E7'
+
+
+def test_concurrent_analyses_keep_their_own_timings(tmp_path, monkeypatch):
+    import asyncio
+    import time
+    pytest.importorskip('whisper')
+    pytest.importorskip('spellchecker')
+    pytest.importorskip('librosa')
+    import audio_probe
+    import bpm_drums
+    import lyrics
+    import session
+
+    def separate(path, workdir, **kw):
+        time.sleep(0.3 if 'slow' in path else 0.0)
+        stems = []
+        for name in ('vocals', 'inst'):
+            stem = Path(workdir) / f'{Path(path).stem}-{name}.wav'
+            stem.write_bytes(b'RIFF')
+            stems.append(stem)
+        return stems[0], stems[1], 0.5
+
+    monkeypatch.setattr(audio_probe, 'duration', lambda path: 10.0)
+    monkeypatch.setattr(session, 'run_separation', separate)
+    monkeypatch.setattr(lyrics, 'transcribe', lambda *a, **kw: [(0.0, 1.0, 'la', -0.1)])
+    monkeypatch.setattr(bpm_drums, 'get_bpm_from_drums', lambda path: (120.0, [0.0, 0.5]))
+    monkeypatch.setattr(session, 'safe_analyze', lambda *a, **kw: ('C', [('C', 0.0, 0.9)]))
+
+    async def both(s):
+        return await asyncio.gather(s.analyze_async('slow.wav'), s.analyze_async('fast.wav'))
+
+    with session.AnalysisSession(max_workers=2) as s:
+        slow, fast = asyncio.run(both(s))
+    assert slow.timings['separation'] >= 0.3
+    assert fast.timings['separation'] < 0.2
+    assert set(slow.timings) == {'plan', 'separation', 'lyrics', 'bpm', 'chords'}
+
+
+def test_run_track_returns_this_tracks_timings(tmp_path, monkeypatch):
+    import session
+
+    class FakeSession:
+        def analyze(self, path):
+            return session.AnalysisResult(
+                title=Path(path).stem, duration=4.0, bpm=60.0, bpm_source='mix',
+                beat_times=[0, 1, 2, 3, 4], key='C', chords=[], lyrics=[],
+                lyric_confidence=0.0, separation_score=0.0,
+                timings={'separation': 2.5, 'lyrics': 1.0},
+            )
+
+    monkeypatch.setattr(ucr, '_SESSION', FakeSession())
+    monkeypatch.setattr(ucr, 'OUTPUT_DIR', tmp_path)
+    out, err, stages, _snap, _elapsed = ucr._run_track('song.wav', ['copy'])
+    assert err is None and out == tmp_path / 'song_chart.txt'
+    assert (tmp_path / 'copy_chart.txt').exists()
+    assert stages['separation'] == 2.5 and stages['lyrics'] == 1.0 and 'chart' in stages
+
+
+def test_weights_configure_respects_torch_home(tmp_path, monkeypatch):
+    import os
+    from models import weights
+    monkeypatch.delenv('UCR_MODELS_DIR', raising=False)
+    monkeypatch.setenv('TORCH_HOME', str(tmp_path / 'mine'))
+    weights.configure()
+    weights.configure()                        # idempotent: still the user's
+    assert os.environ['TORCH_HOME'] == str(tmp_path / 'mine')
+    weights.configure(str(tmp_path / 'store'))
+    assert os.environ['TORCH_HOME'] == str(tmp_path / 'store' / 'torch')
+    assert os.environ['UCR_MODELS_DIR'] == str(tmp_path / 'store')
+
+
+def test_load_whisper_keeps_fp32_parameters(tmp_path, monkeypatch):
+    torch = pytest.importorskip('torch')
+    whisper = pytest.importorskip('whisper')
+    from dataclasses import asdict
+    from whisper.model import ModelDimensions, Whisper
+    from models import weights
+
+    dims = ModelDimensions(                    # tiny's text layout, shrunk
+        n_mels=80, n_audio_ctx=1500, n_audio_state=24, n_audio_head=6, n_audio_layer=1,
+        n_vocab=51865, n_text_ctx=448, n_text_state=24, n_text_head=6, n_text_layer=4,
+    )
+    ref = Whisper(dims)
+    (tmp_path / 'whisper').mkdir()
+    torch.save({'dims': asdict(dims),          # stored in fp16, like OpenAI's
+                'model_state_dict': {k: v.half() for k, v in ref.state_dict().items()}},
+               tmp_path / 'whisper' / 'mini.pt')
+    monkeypatch.setitem(whisper._MODELS, 'mini', 'https://example.invalid/0/mini.pt')
+    monkeypatch.setitem(whisper._ALIGNMENT_HEADS, 'mini', whisper._ALIGNMENT_HEADS['tiny'])
+    monkeypatch.setenv('UCR_MODELS_DIR', str(tmp_path))
+
+    model = weights.load_whisper('mini', device='cpu')
+    assert {p.dtype for p in model.parameters()} == {torch.float32}
+    weight = model.decoder.token_embedding.weight
+    assert torch.equal(weight, ref.decoder.token_embedding.weight.half().float())
+
+
+def test_separation_probe_skipped_without_uvr(tmp_path, monkeypatch):
+    _numpy()
+    pytest.importorskip('soundfile')
+    from models import separation_manager as sm
+    calls = []
+    _fake_backends(monkeypatch, sm, calls)
+    monkeypatch.setattr(sm, 'find_uvr', lambda: None)
+    assert sm._probe('song.wav', tmp_path / 'probe', 2, 25.0) == ('demucs', None)
+    assert calls == []                                 # no excerpt was separated
@@ -11,7 +11,7 @@ from __future__ import annotations
 # ─────────────────────────────────────────────────────────────────────────────
 # STANDARD LIB
 # ─────────────────────────────────────────────────────────────────────────────
-import argparse, math, os, pathlib, shutil, subprocess, sys, tempfile, textwrap
+import argparse, os, pathlib, shutil, subprocess, sys, textwrap
 from inspect import signature
 from pathlib import Path
 
@@ -28,7 +28,8 @@ except Exception:  # heavy deps missing in tests
 # ─────────────────────────────────────────────────────────────────────────────
 # ENV / PATH
 # ─────────────────────────────────────────────────────────────────────────────
-os.environ.setdefault("TORCH_HOME", "/tmp")
+from models.weights import configure as configure_weights
+configure_weights()                # weights → persistent store (never audio)
 os.environ.setdefault("XDG_CACHE_HOME", "/tmp")
 
 for getter, canon in (
@@ -87,13 +88,16 @@ DISCLAIMER = (
 # ─────────────────────────────────────────────────────────────────────────────
 # UTILITIES
 # ─────────────────────────────────────────────────────────────────────────────
-def overwrite_and_remove(path: Path) -> None:
-    """Best-effort secure delete."""
+def overwrite_and_remove(path: Path, block: int = 1 << 20) -> None:
+    """Best-effort secure delete (zero-filled in place, *block* bytes at a time)."""
     if not path.exists():
         return
     try:
-        with open(path, "wb", buffering=0) as f:
-            f.write(b"\x00" * path.stat().st_size)
+        size = path.stat().st_size
+        zeros = bytes(block)
+        with open(path, "r+b", buffering=0) as f:
+            for done in range(0, size, block):
+                f.write(zeros[: min(block, size - done)])
     finally:
         path.unlink(missing_ok=True)
 
@@ -101,19 +105,20 @@ def overwrite_and_remove(path: Path) -> None:
 # ─────────────────────────────────────────────────────────────────────────────
 # Demucs wrapper – cope with old/new signatures
 # ─────────────────────────────────────────────────────────────────────────────
-def run_separation(src: str, workdir: str, *, model="htdemucs_6s", two_stems=None):
+def run_separation(src: str, workdir: str, *, model="htdemucs_6s", two_stems=None, **opts):
     from models.separation_manager import separate_and_score
 
     params = signature(separate_and_score).parameters
+    opts = {k: v for k, v in opts.items() if k in params}
     if "model_name" in params:
-        return separate_and_score(src, workdir, model_name=model, two_stems=two_stems)
-    return separate_and_score(src, workdir)
+        return separate_and_score(src, workdir, model_name=model, two_stems=two_stems, **opts)
+    return separate_and_score(src, workdir, **opts)
 
 
-def safe_analyze(path: str, *, bpm: float, beats: list[float]):
+def safe_analyze(path: str, *, bpm: float, beats: list[float], **opts):
     from chords import analyze_instrumental
     sig = signature(analyze_instrumental).parameters
-    kwargs = {}
+    kwargs = {k: v for k, v in opts.items() if k in sig and v is not None}
     if "bpm" in sig:
         kwargs["bpm"] = bpm
     if "beats" in sig:
@@ -181,51 +186,63 @@ def format_chart(title: str, bpm: float, key: str, time_sig: str,
 # ─────────────────────────────────────────────────────────────────────────────
 # MAIN PIPELINE
 # ─────────────────────────────────────────────────────────────────────────────
-def process_file(path: str) -> Path:
-    from lyrics import transcribe
-    from bpm_drums import get_bpm_from_drums, bpm_via_librosa
-
-    with tempfile.TemporaryDirectory() as tmpdir:
-        # 1. separation ------------------------------------------------------
-        vocal, inst, _ = run_separation(path, tmpdir, model="htdemucs_6s")
-
-        # 2. lyrics ----------------------------------------------------------
-        lyric_lines = transcribe(str(vocal), tmpdir)
-
-        # 3. BPM & beat times -----------------------------------------------
-        try:
-            bpm, beat_times = get_bpm_from_drums(str(inst))
-            src = "drums"
-        except Exception:
-            try:
-                bpm, beat_times = bpm_via_librosa(str(inst))
-                src = "no-vocals"
-            except Exception:
-                bpm, beat_times = bpm_via_librosa(path)
-                src = "mix"
-        print(f"[BPM] {src:9s} → {bpm:.1f}")
-
-        # 4. key + chords ----------------------------------------------------
-        key, chord_seq = safe_analyze(str(inst), bpm=bpm, beats=beat_times)
-
-        # 5. confidence ------------------------------------------------------
-        if lyric_lines:
-            avg_conf = sum(math.exp(c) for *_x, c in lyric_lines) / len(lyric_lines) * 100
-        else:
-            avg_conf = 0.0
+_SESSION = None
+
+
+def process_file(path: str, *, aliases=()) -> Path:
+    """Analyse *path* and write its chart; each name in *aliases* (duplicate
+    inputs) gets the same chart under its own title."""
+    return _process(path, aliases)[0]
+
+
+def _process(path: str, aliases=()) -> tuple[Path, dict[str, float]]:
+    """:func:`process_file`, also returning this track's stage timings."""
+    global _SESSION
+    from session import AnalysisSession
+    from metrics import stage
 
-        # 6. chart -----------------------------------------------------------
-        title = Path(path).stem
-        chart = format_chart(title, bpm, key, TIME_SIGNATURE,
-                             lyric_lines, chord_seq, avg_conf, beat_times)
+    if _SESSION is None:          # settings come from the UCR_* environment
+        _SESSION = AnalysisSession()
+    result = _SESSION.analyze(path)
 
+    timings = dict(result.timings)
+    with stage("chart", timings):
         OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-        out_path = OUTPUT_DIR / f"{title}_chart.txt"
-        out_path.write_text(chart, encoding="utf-8")
+        out_path = OUTPUT_DIR / f"{result.title}_chart.txt"
+        out_path.write_text(result.to_chart(), encoding="utf-8")
+        for alias in aliases:
+            (OUTPUT_DIR / f"{alias}_chart.txt").write_text(
+                result.to_chart(alias), encoding="utf-8"
+            )
+    return out_path, timings
 
-        overwrite_and_remove(vocal)
-        overwrite_and_remove(inst)
-        return out_path
+
+# ─────────────────────────────────────────────────────────────────────────────
+# BATCH WORKERS – one track per process when --jobs > 1
+# ─────────────────────────────────────────────────────────────────────────────
+def _init_track_worker(threads: int, max_memory: int | None) -> None:
+    from resources import configure
+    os.environ.pop("UCR_METRICS_FILE", None)   # only the parent writes the textfile
+    os.environ.pop("UCR_MAX_MEMORY", None)     # the parent's budget is split, not shared
+    configure(threads=threads, max_memory=str(max_memory) if max_memory else None)
+
+
+def _run_track(path: str, aliases: list[str], *, in_worker: bool = False):
+    """Process one track; return (chart path | None, error | None,
+    stage timings, metrics snapshot, wall time)."""
+    import time
+    import metrics
+
+    if in_worker:   # ship only this track's metrics back to the parent
+        metrics.REGISTRY.__init__()
+    t0 = time.perf_counter()
+    out = err = None
+    stages: dict[str, float] = {}
+    try:
+        out, stages = _process(path, aliases)
+    except Exception as e:
+        err = str(e)
+    return (out, err, stages, metrics.REGISTRY.snapshot(), time.perf_counter() - t0)
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -247,12 +264,108 @@ def main() -> None:
             • Run without arguments to be prompted for each file
             • --all            → process every file
             • list of names    → process those specific files
+
+            Whisper backend (defaults: base model, fp32, auto language):
+            • --whisper-model small --whisper-int8 --language en --greedy
+            • --whisper-workers 4  → decode long stems in parallel chunks
+            • --demucs-jobs 4      → separate one long track in parallel windows
+            • --stream             → memory-bounded separation for very long inputs
+            • --probe              → pick Demucs/UVR on short excerpts, then run one
+            • --no-dedupe          → analyse duplicate inputs separately
+            • --chroma cqt22k|stft --beat-sync  → faster chord front-ends
+
+            Resources:
+            • --threads 8 --max-memory 12G  → cap torch/BLAS/ffmpeg threads and
+              stream (or refuse) tracks whose estimated memory exceeds the budget
+            • --metrics-file /var/lib/node_exporter/ucr.prom  → Prometheus textfile
+            • --models-dir /srv/ucr-models --offline  → persistent weight store
+            • --jobs 2  → process tracks in parallel, longest first, with ETA
         """),
     )
     p.add_argument("tracks", nargs="*", metavar="TRACK")
     p.add_argument("--all", action="store_true")
+    p.add_argument("--whisper-model", metavar="SIZE",
+                   help="Whisper model size (env UCR_WHISPER_MODEL)")
+    p.add_argument("--whisper-int8", action="store_true",
+                   help="int8 dynamic quantization for CPU inference (env UCR_WHISPER_INT8)")
+    p.add_argument("--language", metavar="CODE",
+                   help="pin the lyric language, skipping detection (env UCR_WHISPER_LANGUAGE)")
+    p.add_argument("--greedy", action="store_true",
+                   help="greedy decoding, no temperature fallback (env UCR_WHISPER_GREEDY)")
+    p.add_argument("--whisper-workers", type=int, metavar="N",
+                   help="split long vocal stems at silences across N processes "
+                        "(env UCR_WHISPER_WORKERS)")
+    p.add_argument("--demucs-jobs", type=int, metavar="N",
+                   help="separate overlapping windows of a long track across N "
+                        "processes (env UCR_DEMUCS_JOBS)")
+    p.add_argument("--stream", action="store_true",
+                   help="separate segment by segment, writing stems incrementally "
+                        "(env UCR_DEMUCS_STREAM)")
+    p.add_argument("--probe", action="store_true",
+                   help="choose the separation backend on short excerpts and run only "
+                        "the winner on the full track (env UCR_SEPARATION_PROBE)")
+    p.add_argument("--probe-excerpts", type=int, metavar="N",
+                   help="excerpts per probe (env UCR_PROBE_EXCERPTS, default 2)")
+    p.add_argument("--probe-seconds", type=float, metavar="S",
+                   help="excerpt length in seconds (env UCR_PROBE_SECONDS, default 25)")
+    p.add_argument("--no-dedupe", action="store_true",
+                   help="don't group duplicate/near-duplicate inputs")
+    p.add_argument("--chroma", choices=("cqt", "cqt22k", "stft"),
+                   help="chord chroma front-end (env UCR_CHROMA, default cqt)")
+    p.add_argument("--beat-sync", action="store_true",
+                   help="pool chroma between detected beats (env UCR_CHROMA_BEAT_SYNC)")
+    p.add_argument("--threads", type=int, metavar="N",
+                   help="total CPU threads for torch/BLAS/ffmpeg/workers (env UCR_THREADS)")
+    p.add_argument("--max-memory", metavar="SIZE",
+                   help="memory budget per track, e.g. 12G (env UCR_MAX_MEMORY)")
+    p.add_argument("--jobs", type=int, default=1, metavar="N",
+                   help="tracks processed in parallel (threads are split between them)")
+    p.add_argument("--models-dir", metavar="DIR",
+                   help="persistent model weight store (env UCR_MODELS_DIR)")
+    p.add_argument("--offline", action="store_true",
+                   help="never download weights; fail fast if missing (env UCR_OFFLINE)")
+    p.add_argument("--metrics-file", metavar="PATH",
+                   help="Prometheus textfile refreshed during the run (env UCR_METRICS_FILE)")
     args = p.parse_args()
 
+    if args.models_dir or args.offline:
+        configure_weights(args.models_dir, offline_mode=args.offline or None)
+
+    import metrics
+    if args.metrics_file:
+        os.environ["UCR_METRICS_FILE"] = args.metrics_file
+
+    from resources import configure
+    lim = configure(threads=args.threads, max_memory=args.max_memory)
+    print(f"[Resources] {lim.threads} threads, memory budget "
+          f"{f'{lim.max_memory / 1024 ** 3:.1f} GiB' if lim.max_memory else 'unlimited'}")
+
+    # lyrics.transcribe reads these at call time
+    if args.whisper_model:
+        os.environ["UCR_WHISPER_MODEL"] = args.whisper_model
+    if args.whisper_int8:
+        os.environ["UCR_WHISPER_INT8"] = "1"
+    if args.language:
+        os.environ["UCR_WHISPER_LANGUAGE"] = args.language
+    if args.greedy:
+        os.environ["UCR_WHISPER_GREEDY"] = "1"
+    if args.whisper_workers:
+        os.environ["UCR_WHISPER_WORKERS"] = str(args.whisper_workers)
+    if args.demucs_jobs:
+        os.environ["UCR_DEMUCS_JOBS"] = str(args.demucs_jobs)
+    if args.stream:
+        os.environ["UCR_DEMUCS_STREAM"] = "1"
+    if args.probe:
+        os.environ["UCR_SEPARATION_PROBE"] = "1"
+    if args.probe_excerpts:
+        os.environ["UCR_PROBE_EXCERPTS"] = str(args.probe_excerpts)
+    if args.probe_seconds:
+        os.environ["UCR_PROBE_SECONDS"] = str(args.probe_seconds)
+    if args.chroma:
+        os.environ["UCR_CHROMA"] = args.chroma
+    if args.beat_sync:
+        os.environ["UCR_CHROMA_BEAT_SYNC"] = "1"
+
     selection: list[Path]
 
     if args.all:
@@ -278,13 +391,88 @@ def main() -> None:
             print("Nothing selected. Exiting.")
             return
 
-    for f in selection:
-        print("\nProcessing", f.name)
-        try:
-            out = process_file(str(f))
+    groups = [[f] for f in selection]
+    if len(selection) > 1 and not args.no_dedupe:
+        from fingerprint import group_duplicates
+        groups = group_duplicates(selection)
+
+    # pre-flight: probe every track, predict its cost, flag special modes
+    from scheduler import CostModel, Eta, describe, lpt_order, preflight
+    from resources import pool_size, worker_memory, worker_threads
+
+    dups_of = {g[0]: g[1:] for g in groups}
+    jobs = pool_size(min(max(1, args.jobs), len(dups_of)))
+    budget = worker_memory(jobs)
+    if jobs > 1 and budget is not None:
+        print(f"[Resources] {jobs} parallel tracks, {budget / 1024 ** 3:.1f} GiB each")
+    model = CostModel.load()
+    info, cost = preflight(list(dups_of), model, budget=budget)
+    order = lpt_order(list(dups_of), cost)
+    print("\nPlan (longest first):")
+    for f in order:
+        print(describe(f, info[f], cost[f]))
+
+    runnable = []
+    for f in order:
+        if "refused" in info[f]["plan"]:
+            print("⚠️  Skipping", f.name, "–", info[f]["plan"]["refused"])
+            metrics.inc("ucr_failures_total", stage="plan")
+            metrics.inc("ucr_tracks_total", 1 + len(dups_of[f]), status="failed")
+        else:
+            runnable.append(f)
+    metrics.flush()
+
+    eta = Eta({f: cost[f] for f in runnable}, workers=jobs)
+    done = 0
+
+    def finish(f: Path, out, err, stages, elapsed) -> None:
+        nonlocal done
+        done += 1
+        dups = dups_of[f]
+        if err is None:
             print("Saved chart to", out)
-        except Exception as e:
-            print("⚠️  Failed on", f.name, "–", e)
+            for d in dups:
+                print("  ↳ duplicate:", d.name)
+            metrics.inc("ucr_tracks_total", 1 + len(dups), status="ok")
+            model.update(stages, info[f]["duration"])
+            model.save()
+        else:
+            print("⚠️  Failed on", f.name, "–", err)
+            metrics.inc("ucr_tracks_total", 1 + len(dups), status="failed")
+        eta.finish(f, elapsed)
+        print(eta.line(done, len(runnable)))
+        metrics.flush()
+
+    if jobs == 1:
+        for f in runnable:
+            print("\nProcessing", f.name)
+            out, err, stages, _snap, elapsed = _run_track(str(f), [d.stem for d in dups_of[f]])
+            finish(f, out, err, stages, elapsed)
+    else:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+
+        print(f"\nProcessing {len(runnable)} tracks on {jobs} workers")
+        with ProcessPoolExecutor(
+            max_workers=jobs,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_track_worker,
+            initargs=(worker_threads(jobs), budget),
+        ) as pool:
+            # submitted longest-first, so idle workers always take the
+            # longest remaining track (greedy LPT)
+            futures = {pool.submit(_run_track, str(f), [d.stem for d in dups_of[f]],
+                                   in_worker=True): f
+                       for f in runnable}
+            for fut in as_completed(futures):
+                f = futures[fut]
+                try:
+                    out, err, stages, snap, elapsed = fut.result()
+                    metrics.REGISTRY.merge(snap)
+                except Exception as e:   # worker crashed (e.g. OOM-killed)
+                    out, err, stages, elapsed = None, str(e), {}, 0.0
+                print(f"\n[{f.name}]", end=" ")
+                finish(f, out, err, stages, elapsed)
 
 
 if __name__ == "__main__":